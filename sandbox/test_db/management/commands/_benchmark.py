@@ -0,0 +1,30 @@
+import random
+import timeit
+
+from django.test import RequestFactory
+
+from ...models import Main, Parent
+from ...views import MainViewSet
+
+
+def get_table(path='/main/table/'):
+    request = RequestFactory().get(path)
+    return MainViewSet(request, ('table',)).table
+
+
+def create_objects(count, seed=0):
+    """
+    Unsaved Main objects with random values, no database needed.
+    """
+    random.seed(seed)
+    parents = [Parent(pk=pk) for pk in range(1, 11)]
+    return [Main(pk=pk, parent=parents[pk % len(parents)])
+            for pk in range(1, count + 1)]
+
+
+def get_rate(func, count, repeat):
+    """
+    Best of `repeat` runs of func in `count` items per second.
+    """
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    return count / seconds
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from ._benchmark import create_objects, get_rate, get_table
+
+
+class Command(BaseCommand):
+    help = 'Measure how fast table rows are rendered by the compiled columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', '--rows',
+            dest='rows',
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            '-r', '--repeat',
+            dest='repeat',
+            type=int,
+            default=5,
+        )
+
+    def handle(self, *, rows, repeat, **options):
+        table = get_table()
+        objects = create_objects(rows)
+
+        def render():
+            return [row.data for row in table.get_rows(
+                objects, table.columns, table.url_templates,
+                table.row_action_classes)]
+
+        rate = get_rate(render, rows, repeat)
+        self.stdout.write(f'{len(table.columns)} columns: {rate:,.0f} rows/s')
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+
+from htmx_viewsets.chart import encode_typed_array
+from htmx_viewsets.serializers import JsonSerializer, OrjsonSerializer,\
+    numpy, orjson
+
+from ._benchmark import create_objects, get_rate, get_table
+
+
+CHART_FIELDS = ('decimal', 'float', 'integer', 'smallinteger')
+
+
+class Command(BaseCommand):
+    help = 'Measure the JSON encoding of table pages and chart data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', '--rows',
+            dest='rows',
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            '-r', '--repeat',
+            dest='repeat',
+            type=int,
+            default=5,
+        )
+
+    def get_payloads(self, rows):
+        table = get_table()
+        objects = create_objects(rows)
+        table_data = {
+            'draw': 2, 'recordsTotal': rows, 'recordsFiltered': rows,
+            'data': [row.data for row in table.get_rows(
+                objects, table.columns, table.url_templates,
+                table.row_action_classes)],
+        }
+        labels = [str(obj.datetime) for obj in objects]
+        columns = {name: [getattr(obj, name) for obj in objects]
+                   for name in CHART_FIELDS}
+        chart_data = {'labels': labels, 'datasets': [
+            {'label': name, 'data': column}
+            for name, column in columns.items()]}
+
+        def typed(encode, key='data'):
+            return lambda: {'labels': labels, 'datasets': [
+                {'label': name, key: encode(column)}
+                for name, column in columns.items()]}
+
+        # Builders of the payloads, typed columns are encoded while timed
+        builders = {
+            'table': lambda: table_data,
+            'chart': lambda: chart_data,
+            'chart typed': typed(encode_typed_array, 'typed'),
+        }
+        if numpy is not None:
+            builders['chart numpy'] = typed(
+                lambda column: numpy.array(column, dtype=float))
+        return builders
+
+    def handle(self, *, rows, repeat, **options):
+        serializers = {
+            'JsonResponse': lambda data: JsonResponse(
+                data, encoder=DjangoJSONEncoder).content,
+            'JsonSerializer': JsonSerializer().dumps,
+        }
+        if orjson is not None:
+            serializers['OrjsonSerializer'] = OrjsonSerializer().dumps
+
+        for name, build in self.get_payloads(rows).items():
+            for serializer_name, dumps in serializers.items():
+                try:
+                    size = len(dumps(build()))
+                except TypeError:  # e.g. NumPy arrays in JsonResponse
+                    continue
+                rate = get_rate(lambda: dumps(build()), rows, repeat)
+                self.stdout.write(f'{name} {serializer_name}: '
+                                  f'{rate:,.0f} rows/s, {size:,} bytes')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from htmx_viewsets.table.action import UrlTemplates
+
+from ._benchmark import get_rate, get_table
+
+
+CODES = ('detail', 'update', 'delete')
+
+
+class Command(BaseCommand):
+    help = 'Compare the row action URLs of UrlTemplates with reverse()'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', '--rows',
+            dest='rows',
+            type=int,
+            default=10000,
+        )
+        parser.add_argument(
+            '-r', '--repeat',
+            dest='repeat',
+            type=int,
+            default=5,
+        )
+
+    def handle(self, *, rows, repeat, **options):
+        url_names = get_table().url_names
+        url_templates = UrlTemplates(url_names)
+        pks = range(1, rows + 1)
+
+        def with_reverse():
+            return [reverse(url_names[code], kwargs={'pk': pk})
+                    for pk in pks for code in CODES]
+
+        def with_templates():
+            return [url_templates.get_url(code, pk)
+                    for pk in pks for code in CODES]
+
+        assert with_reverse() == with_templates()
+        for name, func in (('reverse', with_reverse),
+                           ('UrlTemplates', with_templates)):
+            rate = get_rate(func, rows, repeat)
+            self.stdout.write(f'{name}: {rate:,.0f} rows/s')
@@ -0,0 +1,761 @@
+import csv
+import datetime
+import json
+import re
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from unittest import mock, skipIf
+from urllib.parse import urlsplit
+
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F, StdDev, Variance
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase,\
+    TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+
+from htmx_viewsets import aggregates, chart
+from htmx_viewsets.aggregates import AggregateEngine, Median, Percentile
+from htmx_viewsets.chart import LttbDownsampler, MinMaxDownsampler
+from htmx_viewsets.forms import GroupByForm
+from htmx_viewsets.results import CacheSingleFlight, PageCache,\
+    ResultCache, SingleFlight
+from htmx_viewsets.rollups import Rollup
+from htmx_viewsets.search import SearchIndex, SqliteFtsIndex
+from htmx_viewsets.serializers import JsonSerializer
+from htmx_viewsets.table.action import UrlTemplates
+from htmx_viewsets.table.cell import Cell
+from htmx_viewsets.table.column import Column
+from htmx_viewsets.table.counter import CachedCounter, EstimatedCounter
+from htmx_viewsets.table.keyset import Keyset
+from htmx_viewsets.table.table import Table
+from htmx_viewsets.views import HtmxTableView
+from htmx_viewsets.viewsets import modelviewset_factory
+
+from test_db.models import Main, Parent
+from test_db.views import MainViewSet
+
+
+class ViewsetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        parents = [Parent.objects.create() for _ in range(3)]
+        for i in range(20):
+            Main.objects.create(parent=parents[i % 3])
+
+    def setUp(self):
+        caches['default'].clear()  # Result cache and data versions
+
+
+class ChartQueryTest(ViewsetTestCase):
+    def test_chart_data_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/main/chart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['labels']), 20)
+
+    def test_grouped_chart_data_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/main/chart/?group_by=parent'
+                '&aggregates=sum&aggregate_fields=integer')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['labels']), 3)
+
+    def test_query_count_independent_of_data_fields(self):
+        data_fields = ['integer', 'float', 'decimal', 'smallinteger',
+                       'positiveinteger', 'positivesmallinteger']
+        for count in (1, len(data_fields)):
+            viewset_class = modelviewset_factory(
+                model=Main, permissions=[], namespace=f'chart_{count}',
+                fields=['name', *data_fields[:count]])
+            viewset = viewset_class(RequestFactory().get('/'), ('chart',))
+            with self.subTest(data_fields=count), self.assertNumQueries(1):
+                data = viewset.chart.data
+            self.assertEqual(len(data['datasets']), count)
+            self.assertEqual(len(data['labels']), 20)
+
+
+class DownsamplerTest(ViewsetTestCase):
+    def get_rows(self):
+        """
+        (index, value) rows of a wave with a spike and a dip.
+        """
+        rows = [(i, (i % 50) - 25) for i in range(500)]
+        rows[123] = (123, 1000)
+        rows[321] = (321, -1000)
+        return rows
+
+    def assert_downsampled(self, downsampler, rows):
+        result = [*downsampler.reduce(iter(rows), len(rows))]
+        self.assertLessEqual(len(result), downsampler.threshold)
+        self.assertEqual(result[0], rows[0])
+        self.assertEqual(result[-1], rows[-1])
+        self.assertEqual(result, sorted(result))  # Order is kept
+        return result
+
+    def test_lttb(self):
+        rows = self.get_rows()
+        for numpy in (chart.numpy, None):
+            with self.subTest(numpy=numpy is not None), \
+                    mock.patch.object(chart, 'numpy', numpy):
+                result = self.assert_downsampled(
+                    LttbDownsampler(50, [1]), rows)
+                self.assertIn(rows[123], result)
+                self.assertIn(rows[321], result)
+
+    def test_min_max(self):
+        rows = self.get_rows()
+        downsampler = MinMaxDownsampler(50, [1])
+        result = self.assert_downsampled(downsampler, rows)
+        self.assertEqual(len(result), 50)
+        # Two rows per bucket of 20, labelled with its first and last row
+        for start in range(0, 500, 20):
+            bucket = [value for _, value in rows[start:start + 20]]
+            kept = [value for index, value in result
+                    if start <= index < start + 20]
+            self.assertEqual(sorted(kept), [min(bucket), max(bucket)])
+
+    def test_downsample_queryset(self):
+        def get_values_list():
+            return Main.objects.order_by('pk').values_list('pk', 'integer')
+
+        rows = [*get_values_list()]
+        with self.assertNumQueries(1):  # Short series: read once
+            self.assertEqual(
+                LttbDownsampler(20, [1]).downsample(get_values_list()), rows)
+        result = LttbDownsampler(5, [1]).downsample(get_values_list())
+        self.assertEqual(len(result), 5)
+        self.assertEqual((result[0], result[-1]), (rows[0], rows[-1]))
+
+
+class TimeBucketingTest(ViewsetTestCase):
+    viewset_class = modelviewset_factory(
+        model=Main, permissions=[], namespace='time_bucketing',
+        fields=['datetime', 'integer'])
+
+    def get_chart(self, step):
+        start = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        for i, pk in enumerate(Main.objects.order_by('pk')
+                               .values_list('pk', flat=True)):
+            Main.objects.filter(pk=pk).update(datetime=start + i * step)
+        viewset = self.viewset_class(RequestFactory().get('/'), ('chart',))
+        chart = viewset.chart
+        chart.max_data_points = 10
+        return chart
+
+    def test_short_series_is_not_bucketed(self):
+        chart = self.get_chart(datetime.timedelta(days=1))
+        chart.max_data_points = 20
+        self.assertIsNone(chart.get_bucket_lookup())
+
+    def test_finest_fitting_bucket(self):
+        chart = self.get_chart(datetime.timedelta(days=1))  # 19 days
+        self.assertEqual(chart.get_bucket_lookup(), 'trunc_week')
+        chart = self.get_chart(datetime.timedelta(hours=1))  # 19 hours
+        self.assertEqual(chart.get_bucket_lookup(), 'trunc_day')
+
+    def test_bucketed_data(self):
+        chart = self.get_chart(datetime.timedelta(days=1))
+        labels = chart.data['labels']
+        self.assertLessEqual(len(labels), 10)
+        self.assertEqual(labels, sorted(labels))
+
+    def test_downsampled_without_fitting_bucket(self):
+        chart = self.get_chart(datetime.timedelta(days=3 * 365))  # 57 years
+        self.assertIsNone(chart.get_bucket_lookup())
+        data = chart.data
+        self.assertEqual(len(data['labels']), 10)  # LTTB
+        first, last = Main.objects.order_by('pk')[::19]
+        self.assertEqual(data['labels'][0], str(first.datetime))
+        self.assertEqual(data['labels'][-1], str(last.datetime))
+
+
+class CounterTest(ViewsetTestCase):
+    def test_cached_count_per_filter(self):
+        queryset = Main.objects.filter(parent__isnull=False)
+        parent = Parent.objects.first()
+        with self.assertNumQueries(1):
+            self.assertEqual(CachedCounter().count(queryset), 20)
+        with self.assertNumQueries(0):  # Ordering is normalized
+            self.assertEqual(CachedCounter().count(queryset.order_by('-pk')),
+                             20)
+        with self.assertNumQueries(1):
+            self.assertEqual(CachedCounter().count(queryset.filter(
+                parent=parent)), 7)
+
+    def test_cached_count_expires(self):
+        queryset = Main.objects.all()
+        self.assertEqual(CachedCounter().count(queryset), 20)
+        Main.objects.create()
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCounter().count(queryset), 20)
+        expired = time.time() + CachedCounter.timeout + 1
+        with mock.patch('time.time', return_value=expired), \
+                self.assertNumQueries(1):
+            self.assertEqual(CachedCounter().count(queryset), 21)
+
+    @skipIf(connection.vendor == 'postgresql', 'Estimates on PostgreSQL')
+    def test_estimated_count_falls_back_to_exact_count(self):
+        counter = EstimatedCounter()
+        counter.threshold = 0
+        with self.assertNumQueries(1):  # COUNT, no EXPLAIN on SQLite
+            self.assertEqual(counter.count(Main.objects.all()), 20)
+
+
+class TableQueryTest(ViewsetTestCase):
+    def test_table_page_with_foreign_keys(self):
+        """
+        Count and page, the parent column is loaded with select_related.
+        """
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/main/table/?draw=1&start=0&length=20')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['recordsTotal'], 20)
+        self.assertEqual(len(data['data']), 20)
+        parent = Parent.objects.first()
+        self.assertIn(str(parent), str(data['data']))
+
+
+    def test_streamed_table_counts_before_streaming(self):
+        request = RequestFactory().get('/main/table/?length=5')
+        table = MainViewSet(request, ('table',)).table
+        with self.assertNumQueries(1):  # Total = filtered count
+            chunks = table.iter_data(JsonSerializer().dumps)
+        data = json.loads(b''.join(chunks))
+        self.assertEqual(data['recordsFiltered'], 20)
+        self.assertEqual(len(data['data']), 5)
+
+
+    def test_compact_table_request(self):
+        """
+        table.html only sends the parameters the table reads.
+        """
+        response = self.client.get(
+            '/main/table/?start=5&length=5'
+            '&order[0][column]=2&order[0][dir]=desc'
+            '&columns[3][visible]=false')
+        data = response.json()
+        names = sorted(Main.objects.values_list('name', flat=True),
+                       reverse=True)
+        self.assertEqual(data['recordsFiltered'], 20)
+        self.assertEqual(len(data['data']), 5)
+        self.assertIn(f'>{names[5]}<', data['data'][0][2])
+        self.assertEqual(data['data'][0][3], '')
+
+    def test_annotated_queryset_with_hidden_column(self):
+        """
+        Annotations are not passed to only().
+        """
+        viewset_classes = [
+            modelviewset_factory(
+                queryset=Main.objects.annotate(int2=F('integer')),
+                permissions=[]),
+            modelviewset_factory(
+                queryset=Main.objects.annotate(int2=F('integer')),
+                permissions=[], fields=['id', 'name', 'integer', 'int2']),
+        ]
+        for viewset_class in viewset_classes:
+            with self.subTest(fields=viewset_class.fields):
+                request = RequestFactory().get(
+                    '/main/table/',
+                    {'length': 5, 'columns[3][visible]': 'false'})
+                table = viewset_class(request, ('table',)).table
+                data = table.data
+                self.assertEqual(len(data['data']), 5)
+                self.assertIn('int2', [column.name for column in table.columns])
+
+
+class UpperCell(Cell):
+    def render(self):
+        return super().render().upper()
+
+
+class UpperColumn(Column):
+    cell_class = UpperCell
+
+
+class CellClassTable(Table):
+    def get_columns(self, qs):
+        return [UpperColumn(field) if field.name == 'name' else Column(field)
+                for field in self.fields]
+
+
+class CellClassTest(ViewsetTestCase):
+    viewset_class = modelviewset_factory(
+        model=Main, permissions=[], table_class=CellClassTable)
+
+    def test_custom_cell_class_renders_cells(self):
+        request = RequestFactory().get('/main/table/', {'length': 5})
+        table = self.viewset_class(request, ('table',)).table
+        names = [*Main.objects.order_by('pk')
+                 .values_list('name', flat=True)[:5]]
+        index = [column.name for column in table.columns].index('name')
+        self.assertEqual(
+            [row[index] for row in table.data['data']],
+            [f'<SPAN CLASS="CELL">{name.upper()}</SPAN>' for name in names])
+
+
+class UuidUrls:
+    urlpatterns = [
+        path('<int:pk>/update/', lambda request, pk: None, name='update'),
+        path('<uuid:pk>/detail/', lambda request, pk: None, name='detail'),
+    ]
+
+
+@override_settings(ROOT_URLCONF=UuidUrls)
+class UrlTemplatesTest(SimpleTestCase):
+    def test_urls_without_int_pk_are_reversed_per_row(self):
+        url_templates = UrlTemplates({'update': 'update', 'detail': 'detail'})
+        pk = uuid.UUID('12345678-1234-5678-1234-567812345678')
+        self.assertEqual(url_templates.get_url('update', 3), '/3/update/')
+        self.assertEqual(url_templates.get_url('detail', pk),
+                         f'/{pk}/detail/')
+
+
+class ConditionalTest(ViewsetTestCase):
+    url = '/main/table/?start=0&length=5'
+
+    def test_unchanged_data_is_not_modified(self):
+        response = self.client.get(f'{self.url}&draw=1')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(f'{self.url}&draw=2',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(f'{self.url}&draw=3&order[0][column]=2',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        Main.objects.order_by('pk').first().save()
+        response = self.client.get(f'{self.url}&draw=4',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+class TableDrawsTest(ViewsetTestCase):
+    def get(self, client, draw):
+        return self.client.get('/main/table/?start=0&length=5',
+                               HTTP_X_TABLE_CLIENT=client,
+                               HTTP_X_TABLE_DRAW=str(draw))
+
+    def test_older_draw_is_dropped(self):
+        self.assertEqual(self.get('a', 2).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.get('a', 1)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get('b', 1).status_code, 200)  # Other client
+        self.assertEqual(self.get('a', 3).status_code, 200)
+
+
+class PageCacheTest(TransactionTestCase):
+    """
+    The prefetch runs in another thread, it can't see the data of a test
+    transaction.
+    """
+    name = 'main_viewset:main'
+
+    def setUp(self):
+        caches['default'].clear()
+        ViewsetTestCase.setUpTestData()
+        self.page_cache = PageCache()
+        self.page_cache.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.page_cache.executor.shutdown)
+        patcher = mock.patch.object(HtmxTableView, 'page_cache',
+                                    self.page_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, start, draw):
+        return self.client.get(
+            f'/main/table/?start={start}&length=5&draw={draw}')
+
+    def test_next_page_is_prefetched(self):
+        response = self.get(0, 1)
+        self.assertEqual(response.headers['X-Page-Cache'], 'miss')
+        self.page_cache.executor.submit(lambda: None).result()  # Prefetched
+
+        response = self.get(5, 2)
+        self.assertEqual(response.headers['X-Page-Cache'], 'hit')
+        self.assertEqual(response.json()['draw'], 3)  # Of this request
+        stats = self.page_cache.get_stats(self.name)
+        self.assertEqual((stats['hits'], stats['prefetches']), (1, 1))
+
+    def test_failed_prefetch_is_logged(self):
+        def build():
+            raise ValueError
+        with self.assertLogs('htmx_viewsets.results', 'ERROR'):
+            self.page_cache.prefetch(self.name, 'state', [1], build).result()
+        self.assertEqual(self.page_cache.pending, set())
+
+    def test_prefetch_is_skipped_if_too_many_are_pending(self):
+        self.page_cache.pending = {str(i) for i in range(
+            self.page_cache.max_pending)}
+        self.assertIsNone(
+            self.page_cache.prefetch(self.name, 'state', [1], dict))
+
+
+class KeysetTable(Table):
+    keyset_class = Keyset
+
+
+class KeysetTest(ViewsetTestCase):
+    viewset_class = modelviewset_factory(
+        model=Main, permissions=[], table_class=KeysetTable)
+    orderings = {
+        'pk ascending': ({}, ['pk']),
+        'name descending': ({'order[0][column]': 2, 'order[0][dir]': 'desc'},
+                            ['-name', '-pk']),
+    }
+    streaming = False
+
+    def get_page(self, params, start, length=5, cursor=None):
+        params = {**params, 'start': start, 'length': length,
+                  'keyset': cursor or ''}
+        request = RequestFactory().get('/main/table/', params)
+        table = self.viewset_class(request, ('table',)).table
+        with CaptureQueriesContext(connection) as queries:
+            if self.streaming:
+                data = json.loads(b''.join(
+                    table.iter_data(JsonSerializer().dumps)))
+            else:
+                data = table.data
+        pks = [int(re.search(r'>(\d+)<', row[1]).group(1))
+               for row in data['data']]
+        offsets = [query for query in queries.captured_queries
+                   if 'OFFSET' in query['sql']]
+        return pks, data['keyset'], offsets
+
+    def test_pages(self):
+        for name, (params, ordering) in self.orderings.items():
+            with self.subTest(ordering=name):
+                self.assert_pages(params, ordering)
+
+    def assert_pages(self, params, ordering):
+        expected = [*Main.objects.order_by(*ordering)
+                    .values_list('pk', flat=True)]
+        pks, first_cursor, _ = self.get_page(params, 0)
+        self.assertEqual(pks, expected[0:5])
+
+        pks, cursor, offsets = self.get_page(params, 5, cursor=first_cursor)
+        self.assertEqual(pks, expected[5:10])  # Next
+        self.assertEqual(offsets, [])
+
+        pks, _, offsets = self.get_page(params, 5, cursor=cursor)
+        self.assertEqual(pks, expected[5:10])  # Reload
+        self.assertEqual(offsets, [])
+
+        pks, _, offsets = self.get_page(params, 0, cursor=cursor)
+        self.assertEqual(pks, expected[0:5])  # Previous
+        self.assertEqual(offsets, [])
+
+        pks, _, offsets = self.get_page(params, 9, length=3, cursor=cursor)
+        self.assertEqual(pks, expected[9:12])  # Other length: offset
+        self.assertEqual(len(offsets), 1)
+
+        pks, _, offsets = self.get_page(params, 15, cursor=cursor)
+        self.assertEqual(pks, expected[15:20])  # Jump: offset
+        self.assertEqual(len(offsets), 1)
+
+
+class StreamedKeysetTest(KeysetTest):
+    streaming = True
+
+
+class ExportTest(ViewsetTestCase):
+    def test_csv_encodes_json_and_durations(self):
+        obj = Main.objects.order_by('pk').first()
+        obj.json = {'a': [1, 2]}
+        obj.duration = datetime.timedelta(days=1, seconds=5)
+        obj.save()
+        response = self.client.get('/main/export/?format=csv')
+        rows = [*csv.reader(
+            b''.join(response.streaming_content).decode().splitlines())]
+        cells = dict(zip(rows[0], rows[1]))
+        self.assertEqual(cells['json'], '{"a":[1,2]}')
+        self.assertEqual(cells['duration'], 'P1DT00H00M05S')
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def run_concurrently(self, single_flights, count=5):
+        """
+        Calls of all single flights while the first build is running.
+        """
+        calls = []
+        started, release = threading.Event(), threading.Event()
+
+        def build():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'rows': 3}
+
+        results = []
+
+        def call(single_flight):
+            results.append(single_flight.do('key', build))
+
+        leader = threading.Thread(target=call, args=(single_flights[0],))
+        leader.start()
+        started.wait(5)
+        threads = [threading.Thread(target=call, args=(single_flight,))
+                   for single_flight in single_flights * count]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)  # Followers are waiting for the leader
+        release.set()
+        for thread in [leader, *threads]:
+            thread.join(5)
+        return calls, results
+
+    def test_single_flight(self):
+        calls, results = self.run_concurrently([SingleFlight()])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'rows': 3}] * 6)
+
+    def test_cache_single_flight(self):
+        """
+        Instances share the cache like processes do.
+        """
+        single_flights = [CacheSingleFlight(), CacheSingleFlight()]
+        for single_flight in single_flights:
+            single_flight.poll_interval = 0.01
+        calls, results = self.run_concurrently(single_flights)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'rows': 3}] * 11)
+
+
+class ResultCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.builds = []
+
+    def get(self, result_cache, state, versions=(1,)):
+        def build():
+            self.builds.append(state)
+            return {'state': state}
+        return result_cache.get_or_set('table', state, [*versions], build)
+
+    def test_hit(self):
+        result_cache = ResultCache('hit')
+        self.assertEqual(self.get(result_cache, 'a'), {'state': 'a'})
+        self.assertEqual(self.get(result_cache, 'a'), {'state': 'a'})
+        self.assertEqual(self.builds, ['a'])
+
+    def test_changed_data_version_misses(self):
+        result_cache = ResultCache('versions')
+        self.get(result_cache, 'a', versions=(1,))
+        self.get(result_cache, 'a', versions=(2,))
+        self.get(result_cache, 'a', versions=(2,))
+        self.assertEqual(self.builds, ['a', 'a'])
+
+    def test_least_recently_used_results_are_evicted(self):
+        result_cache = ResultCache('eviction', max_entries=2)
+        for state in ('a', 'b', 'a', 'c'):  # Evicts b
+            self.get(result_cache, state)
+        self.assertEqual(self.builds, ['a', 'b', 'c'])
+        self.get(result_cache, 'a')
+        self.get(result_cache, 'b')
+        self.assertEqual(self.builds, ['a', 'b', 'c', 'b'])
+        self.assertEqual(len(caches['default'].get(result_cache.index_key)), 2)
+
+
+class GroupByFormTest(SimpleTestCase):
+    defaults = {'aggregates': ['sum'], 'aggregate_fields': ['integer']}
+
+    def get_form(self, path):
+        form = GroupByForm(
+            RequestFactory().get(path), [('parent', 'Parent')],
+            aggregates=[('sum', 'Summe'), ('avg', 'Durchschnitt')],
+            aggregate_fields=[('integer', 'Integer'), ('float', 'Float')],
+            defaults=self.defaults)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.cleaned_data
+
+    def test_defaults_without_group_by_parameters(self):
+        data = self.get_form('/main/')
+        self.assertEqual(data['aggregates'], ['sum'])
+        self.assertEqual(data['aggregate_fields'], ['integer'])
+
+    def test_all_aggregates_deselected(self):
+        data = self.get_form('/main/?group_by=parent')
+        self.assertEqual(data['group_by'], 'parent')
+        self.assertEqual(data['aggregates'], [])
+        self.assertEqual(data['aggregate_fields'], [])
+
+    def test_submitted_aggregates(self):
+        data = self.get_form('/main/?group_by=parent&aggregates=avg')
+        self.assertEqual(data['aggregates'], ['avg'])
+        self.assertEqual(data['aggregate_fields'], [])
+
+
+class FallbackAggregateTest(ViewsetTestCase):
+    functions = {
+        'variance': (Variance, statistics.pvariance),
+        'stddev': (StdDev, statistics.pstdev),
+        'median': (Median, statistics.median),
+        'p90': (Percentile.of(90),
+                lambda values: statistics.quantiles(
+                    values, n=10, method='inclusive')[8]),
+    }
+
+    def get_queryset(self):
+        return AggregateEngine('default').annotate(
+            Main.objects.values('parent').order_by('parent'),
+            Main.objects.all(), 'parent',
+            {name: aggregate('integer')
+             for name, (aggregate, _) in self.functions.items()})
+
+    def get_expected(self):
+        groups = {}
+        for parent, value in Main.objects.values_list('parent', 'integer'):
+            groups.setdefault(parent, []).append(value)
+        return {parent: {name: function(values) for name, (_, function)
+                         in self.functions.items()}
+                for parent, values in groups.items()}
+
+    def assert_rows(self, rows):
+        expected = self.get_expected()
+        self.assertEqual(len(rows), len(expected))
+        for row in rows:
+            for name, value in expected[row['parent']].items():
+                self.assertAlmostEqual(row[name], value, msg=name,
+                                       delta=1e-9 * max(abs(value), 1))
+
+    def assert_aggregates(self):
+        self.assert_rows([*self.get_queryset()])
+        names = ['parent', *self.functions]
+        rows = self.get_queryset().values_list(*names).iterator()
+        self.assert_rows([dict(zip(names, row)) for row in rows])
+
+    @skipIf(aggregates.numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        self.assert_aggregates()
+
+    def test_python(self):
+        with mock.patch.object(aggregates, 'numpy', None):
+            self.assert_aggregates()
+
+
+class ListViewTest(ViewsetTestCase):
+    add_filter = {'x__type': 'f', 'x__lookup': 'name__icontains',
+                  'x__value': 'a'}
+
+    def post(self, path):
+        response = self.client.post(path, self.add_filter)
+        self.assertEqual(response.status_code, 302)
+        return QueryDict(urlsplit(response.headers['Location']).query)
+
+    def test_add_filter_keeps_group_by(self):
+        query = self.post(
+            '/main/?group_by=parent&aggregates=sum&aggregate_fields=integer')
+        self.assertEqual(query['f__name__icontains'], 'a')
+        self.assertEqual(query['group_by'], 'parent')
+        self.assertEqual(query.getlist('aggregates'), ['sum'])
+        self.assertEqual(query.getlist('aggregate_fields'), ['integer'])
+
+    def test_add_filter_without_group_by(self):
+        query = self.post('/main/')
+        self.assertEqual(query['f__name__icontains'], 'a')
+        for name in GroupByForm.base_fields:
+            self.assertNotIn(name, query)
+
+
+class RollupTest(ViewsetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rollup = Rollup('test', Main.objects.all(), 'parent',
+                             ['decimal', 'integer'])
+
+    def get_rows(self):
+        names = sorted(self.rollup.names)
+        return sorted(self.rollup.get_rows(names), key=itemgetter('parent'))
+
+    def get_db_rows(self):
+        annotations = self.rollup.get_annotations()
+        return [*Main.objects.order_by('parent').values('parent').annotate(
+            **annotations).values('parent', *sorted(annotations))]
+
+    def test_rows_match_database(self):
+        """
+        Decimal averages included, they are computed by the database.
+        """
+        self.assertEqual(self.get_rows(), self.get_db_rows())
+
+    def test_summaries_by_bucket(self):
+        self.rollup.get_summaries()
+        cache = caches['default']
+        state = cache.get(self.rollup.key)
+        self.assertEqual(sorted(state['buckets']), ['1', '2', '3'])
+        self.assertNotIn('summaries', state)
+        for bucket in state['buckets']:
+            self.assertIsNotNone(cache.get(self.rollup.get_bucket_key(bucket)))
+
+    def test_dirty_buckets(self):
+        self.rollup.get_summaries()
+        parent = Parent.objects.first()
+        Main.objects.create(parent=parent)
+        self.rollup.mark_dirty([str(parent.pk)])
+        with self.assertNumQueries(1):  # Only the dirty bucket
+            rows = self.get_rows()
+        self.assertEqual(rows, self.get_db_rows())
+
+    def test_evicted_counter(self):
+        parent = Parent.objects.first()
+        self.rollup.mark_dirty([str(parent.pk)])
+        self.rollup.mark_dirty([str(parent.pk)])
+        self.rollup.get_summaries()
+        caches['default'].delete(self.rollup.counter_key)
+        Main.objects.create(parent=parent)
+        self.rollup.mark_dirty([str(parent.pk)])
+        self.assertEqual(self.get_rows(), self.get_db_rows())
+
+
+class SearchIndexTest(ViewsetTestCase):
+    def get_table_pks(self, search_query):
+        request = RequestFactory().get(
+            '/main/table/', {'search[value]': search_query})
+        table = MainViewSet(request, ('table',)).table
+        return sorted(table.queryset.values_list('pk', flat=True))
+
+    def assert_same_results(self, search_index, search_queries):
+        queryset = Main.objects.all()
+        for search_query in search_queries:
+            if not search_index.supports(queryset, search_query):
+                continue
+            with self.subTest(search_query=search_query):
+                results = search_index.search(queryset, search_query)
+                self.assertEqual(
+                    sorted(results.values_list('pk', flat=True)),
+                    self.get_table_pks(search_query))
+
+    def get_search_queries(self):
+        obj = Main.objects.order_by('pk')[3]
+        return [obj.name[2:6], obj.char[:3].lower(), obj.text[1:5],
+                obj.slug[4:], str(obj.pk), '12', 'xyz']
+
+    def test_search_index_matches_table_columns(self):
+        search_index = SearchIndex(Main)
+        self.assertNotIn('text', search_index.fields)
+        self.assert_same_results(search_index, self.get_search_queries())
+
+    @skipIf(connection.vendor != 'sqlite', 'SQLite FTS5')
+    def test_sqlite_fts_index_matches_table_columns(self):
+        search_index = SqliteFtsIndex(Main)
+        search_index.rebuild()
+        self.assert_same_results(search_index, self.get_search_queries())
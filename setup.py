@@ -65,6 +65,8 @@ setup(
     install_requires=install_requires,
     tests_require=tests_require,
     extras_require={
+        'orjson': ['orjson>=3.0.0'],
+        'numpy': ['numpy>=1.19'],
         'test': tests_require,
         'build': build_require,
     },
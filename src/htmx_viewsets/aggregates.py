@@ -0,0 +1,271 @@
+import math
+import statistics
+from array import array
+
+from django.db import NotSupportedError, connections
+from django.db.models import FloatField, QuerySet, Value
+from django.db.models.aggregates import Variance, StdDev
+from django.utils.functional import cached_property
+
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, used for vectorized group reductions
+    numpy = None
+
+
+__all__ = ['Median', 'Percentile', 'AggregateEngine']
+
+
+class PythonAggregate:
+    """
+    Aggregate without SQL, always computed by the AggregateEngine.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+
+
+class Percentile(PythonAggregate):
+    percentile = 50
+
+    @classmethod
+    def of(cls, percentile):
+        return type(f'Percentile{percentile}', (cls,),
+                    {'percentile': percentile})
+
+
+class Median(Percentile):
+    percentile = 50
+
+
+class FallbackValue(Value):
+    """
+    Placeholder of an aggregate computed in Python, NULL in SQL.
+    """
+    contains_aggregate = True
+
+    def __init__(self):
+        super().__init__(None, output_field=FloatField())
+
+
+def reduce_numpy(kind, codes, values, group_count):
+    """
+    One result per group code, NaN for groups without values.
+    """
+    known = ~numpy.isnan(values)
+    codes, values = codes[known], values[known]
+    counts = numpy.bincount(codes, minlength=group_count)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        if kind in (Variance, StdDev):
+            means = numpy.bincount(codes, values, group_count) / counts
+            squares = (values - means[codes]) ** 2
+            result = numpy.bincount(codes, squares, group_count) / counts
+            return numpy.sqrt(result) if kind is StdDev else result
+        order = numpy.lexsort((values, codes))
+        ordered = values[order]
+        starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+        position = starts + kind.percentile / 100 * (counts - 1)
+        last = max(len(ordered) - 1, 0)
+        low = numpy.clip(numpy.floor(position).astype(int), 0, last)
+        high = numpy.clip(numpy.ceil(position).astype(int), 0, last)
+        if not len(ordered):
+            return numpy.full(group_count, numpy.nan)
+        result = ordered[low] + (ordered[high] - ordered[low]) \
+            * (position - low)
+        return numpy.where(counts > 0, result, numpy.nan)
+
+
+def reduce_python(kind, codes, values, group_count):
+    groups = [[] for _ in range(group_count)]
+    for code, value in zip(codes, values):
+        if not math.isnan(value):
+            groups[code].append(value)
+    result = []
+    for group in groups:
+        if not group:
+            result.append(math.nan)
+        elif kind is Variance:
+            result.append(statistics.pvariance(group))
+        elif kind is StdDev:
+            result.append(statistics.pstdev(group))
+        else:
+            group.sort()
+            position = kind.percentile / 100 * (len(group) - 1)
+            low, high = math.floor(position), math.ceil(position)
+            result.append(group[low] + (group[high] - group[low])
+                          * (position - low))
+    return result
+
+
+class FallbackAggregates:
+    """
+    Values of the fallback aggregates per group, computed on first use
+    from one pass over the grouped column values of `source`.
+    """
+    chunk_size = 10000
+
+    def __init__(self, source, group_by, aggregates):
+        self.source = source
+        self.group_by = group_by
+        self.aggregates = aggregates
+
+    @staticmethod
+    def get_field_name(aggregate):
+        if isinstance(aggregate, PythonAggregate):
+            return aggregate.expression
+        return aggregate.get_source_expressions()[0].name
+
+    @cached_property
+    def values(self):
+        fields = sorted({self.get_field_name(aggregate)
+                         for aggregate in self.aggregates.values()})
+        keys = {}
+        codes = array('q')
+        columns = {field: array('d') for field in fields}
+        rows = self.source.order_by().values_list(self.group_by, *fields)
+        for key, *row in rows.iterator(chunk_size=self.chunk_size):
+            codes.append(keys.setdefault(key, len(keys)))
+            for field, value in zip(fields, row):
+                columns[field].append(
+                    math.nan if value is None else float(value))
+
+        reduce = reduce_python
+        if numpy is not None:
+            codes = numpy.frombuffer(codes, dtype='q')
+            columns = {field: numpy.frombuffer(column, dtype='d')
+                       for field, column in columns.items()}
+            reduce = reduce_numpy
+        results = {
+            name: reduce(self.get_kind(aggregate), codes,
+                         columns[self.get_field_name(aggregate)], len(keys))
+            for name, aggregate in self.aggregates.items()
+        }
+        return {
+            key: {name: None if math.isnan(result[code]) else
+                  float(result[code]) for name, result in results.items()}
+            for key, code in keys.items()
+        }
+
+    @staticmethod
+    def get_kind(aggregate):
+        for kind in (StdDev, Variance):
+            if isinstance(aggregate, kind):
+                return kind
+        return aggregate.__class__
+
+    def merge(self, queryset, rows):
+        """
+        Fills the fallback values into dict or tuple rows that hold the
+        group by value.
+        """
+        query = queryset.query
+        if queryset._fields:  # Order of ValuesListIterable
+            names = [*queryset._fields, *(
+                name for name in query.annotation_select
+                if name not in queryset._fields)]
+        else:
+            names = [*query.extra_select, *query.values_select,
+                     *query.annotation_select]
+        if self.group_by not in names:
+            yield from rows
+            return
+        key_index = names.index(self.group_by)
+        indexes = [(names.index(name), name) for name in self.aggregates
+                   if name in names]
+        for row in rows:
+            if isinstance(row, dict):
+                values = self.values.get(row[self.group_by], {})
+                row.update({name: values.get(name) for name in self.aggregates
+                            if name in row})
+            elif isinstance(row, tuple) and indexes:
+                values = self.values.get(row[key_index], {})
+                items = [*row]
+                for index, name in indexes:
+                    items[index] = values.get(name)
+                row = row._make(items) if hasattr(row, '_make') \
+                    else tuple(items)
+            yield row
+
+
+class FallbackQuerySet(QuerySet):
+    """
+    Grouped queryset that merges the fallback aggregates into its rows.
+    """
+    fallback = None
+
+    @classmethod
+    def from_queryset(cls, queryset, fallback):
+        clone = queryset._chain()
+        clone.__class__ = cls
+        clone.fallback = fallback
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.fallback = self.fallback
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = [*self.fallback.merge(
+                self, self._iterable_class(self))]
+        super()._fetch_all()
+
+    def _iterator(self, *args, **kwargs):
+        yield from self.fallback.merge(self, super()._iterator(*args, **kwargs))
+
+
+class AggregateEngine:
+    """
+    Annotates the aggregates the database supports. The others (Python
+    aggregates and those the backend rejects) are computed from the
+    grouped column values and merged into the grouped rows.
+    Ordering by a fallback aggregate has no effect.
+    """
+    fallback_class = FallbackAggregates
+    # SQLite computes these in Python UDFs, one call per row, which fail
+    # on NULL values
+    fallback_vendors = {
+        'sqlite': (Variance, StdDev),
+    }
+
+    # Compiled once per (vendor, aggregate class), shared by all engines
+    supported = {}
+
+    def __init__(self, using):
+        self.connection = connections[using]
+
+    def is_supported(self, queryset, name, aggregate):
+        if isinstance(aggregate, PythonAggregate):
+            return False
+        vendor = self.connection.vendor
+        if isinstance(aggregate, self.fallback_vendors.get(vendor, ())):
+            return False
+        key = (vendor, aggregate.__class__)
+        if key not in self.supported:
+            self.supported[key] = self.compiles(queryset, name, aggregate)
+        return self.supported[key]
+
+    def compiles(self, queryset, name, aggregate):
+        try:
+            query = queryset.annotate(**{name: aggregate}).query
+            query.get_compiler(connection=self.connection).as_sql()
+        except NotSupportedError:
+            return False
+        return True
+
+    def annotate(self, queryset, source, group_by, aggregates):
+        """
+        queryset: grouped by `group_by`, source: the same rows ungrouped
+        """
+        fallback = {}
+        for name, aggregate in aggregates.items():
+            if self.is_supported(queryset, name, aggregate):
+                queryset = queryset.annotate(**{name: aggregate})
+            else:
+                fallback[name] = aggregate
+                queryset = queryset.annotate(**{name: FallbackValue()})
+        if not fallback:
+            return queryset
+        return FallbackQuerySet.from_queryset(
+            queryset, self.fallback_class(source, group_by, fallback))
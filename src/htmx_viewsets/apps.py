@@ -6,3 +6,18 @@ class HtmxViewsetsConfig(AppConfig):
     name = 'htmx_viewsets'
     verbose_name = _('HTMX Viewsets')
     namespace = 'htmx_viewsets'
+
+    def ready(self):
+        from django.db.models import signals
+        from .versions import bump_version, bump_m2m_version
+        from .rollups import rollups
+        from .search import search_indexes
+        signals.post_save.connect(bump_version)
+        signals.post_delete.connect(bump_version)
+        signals.m2m_changed.connect(bump_m2m_version)
+        for signal in (signals.pre_save, signals.pre_delete):
+            signal.connect(rollups.before_change, weak=False)
+        for signal in (signals.post_save, signals.post_delete):
+            signal.connect(rollups.after_change, weak=False)
+        signals.post_save.connect(search_indexes.update, weak=False)
+        signals.post_delete.connect(search_indexes.delete, weak=False)
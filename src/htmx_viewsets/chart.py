@@ -1,13 +1,39 @@
+import sys
 import json
+import base64
 import datetime
+from array import array
+from collections import OrderedDict
 from typing import Iterable
 
+from django.utils.functional import cached_property
 from django.db.models.aggregates import Sum, Count, Avg, Min, Max, Variance,\
     StdDev
+from django.db.models.fields import DateTimeField, DateField
 
 from .fields import ViewsetModelField
 
 
+try:
+    import numpy
+except ImportError:  # NumPy is optional, used for vectorized LTTB
+    numpy = None
+
+
+# Candidates for the time bucketing mode, finest first, with their minimal
+# duration to estimate the maximum number of buckets of a date range.
+BUCKET_LOOKUPS = [
+    ('trunc_second',    datetime.timedelta(seconds=1)),
+    ('trunc_minute',    datetime.timedelta(minutes=1)),
+    ('trunc_hour',      datetime.timedelta(hours=1)),
+    ('trunc_day',       datetime.timedelta(days=1)),
+    ('trunc_week',      datetime.timedelta(weeks=1)),
+    ('trunc_month',     datetime.timedelta(days=28)),
+    ('trunc_quarter',   datetime.timedelta(days=89)),
+    ('trunc_year',      datetime.timedelta(days=365)),
+]
+
+
 DATASET_OPTIONS = {
     Sum: {},
     Count: {},
@@ -19,13 +45,26 @@ DATASET_OPTIONS = {
 }
 
 
+# (JS typed array, array typecode, NumPy dtype, limit) of typed payloads
+INT_TYPES = [
+    ('Int8',    'b',    '<i1',  2 ** 7),
+    ('Int16',   'h',    '<i2',  2 ** 15),
+    ('Int32',   'i',    '<i4',  2 ** 31),
+]
+FLOAT_TYPE = ('Float64', 'd', '<f8', None)
+
+
+def is_typed(data):
+    return numpy is not None and isinstance(data, numpy.ndarray)
+
+
 class Dataset(dict):
     def __init__(self, field, data):
         self.field = field
         self.update({
             'type': 'line',
             'label': field.verbose_name or field.name.title(),
-            'data': [*data],
+            'data': data if is_typed(data) else [*data],
             'color': field.color,
             'borderColor': field.color,
             'backgroundColor': field.color,
@@ -33,13 +72,227 @@ class Dataset(dict):
         })
 
 
+def get_int_type(floats):
+    """
+    Narrowest of INT_TYPES holding all values, None if not all integral.
+    """
+    if numpy is not None:
+        if not len(floats):
+            return INT_TYPES[0]
+        if not (numpy.isfinite(floats).all()
+                and (floats == numpy.floor(floats)).all()):
+            return None
+        low, high = floats.min(), floats.max()
+    else:
+        if not all(x.is_integer() for x in floats):  # False for NaN
+            return None
+        low, high = min(floats, default=0), max(floats, default=0)
+    for int_type in INT_TYPES:
+        limit = int_type[3]
+        if -limit <= low and high < limit:
+            return int_type
+    return None
+
+
+def encode_typed_array(values):
+    """
+    Base64 of a little-endian integer array (all values integral and in
+    range) or Float64 array, None is NaN. Decoded by chart.html.
+    """
+    if numpy is not None:
+        floats = numpy.asarray(values, dtype=float)
+    else:
+        floats = [float('nan') if x is None else float(x) for x in values]
+    int_type = get_int_type(floats)
+    name, code, dtype, _ = int_type or FLOAT_TYPE
+    if numpy is not None:
+        typed = floats.astype(dtype)
+    else:
+        typed = array(code, map(int, floats) if int_type else floats)
+        if sys.byteorder == 'big':
+            typed.byteswap()
+    return {
+        'type': name,
+        'data': base64.b64encode(typed.tobytes()).decode('ascii'),
+    }
+
+
+class TypedDataset(Dataset):
+    """
+    Sends the data as typed array instead of a JSON list.
+    """
+    def __init__(self, field, data):
+        super().__init__(field, ())
+        del self['data']
+        self['typed'] = encode_typed_array(data)
+
+
+class Downsampler:
+    """
+    Reduces an ordered values_list to at most `threshold` rows.
+    The rows are streamed through the database cursor bucket by bucket,
+    so memory is bounded by the bucket size instead of the series length.
+    """
+    chunk_size = 2000
+
+    def __init__(self, threshold, data_indexes):
+        self.threshold = threshold
+        self.data_indexes = data_indexes
+
+    def downsample(self, values_list):
+        """
+        Series up to `threshold` rows are read with a single query, only
+        longer ones are counted and streamed.
+        """
+        rows = [*values_list[:self.threshold + 1]]
+        if len(rows) <= self.threshold or self.threshold < 3:
+            return rows[:self.threshold]
+        count = values_list.count()
+        rows = values_list.iterator(chunk_size=self.chunk_size)
+        return [*self.reduce(rows, count)]
+
+    def reduce(self, rows, count):
+        raise NotImplementedError
+
+    @staticmethod
+    def get_buckets(rows, count, bucket_count):
+        """
+        Yields (index, row) lists of (almost) equal size.
+        Rows beyond `count` (inserted while streaming) go to the last bucket.
+        """
+        every = count / bucket_count
+        bucket, bucket_nr = [], 1
+        for row_nr, item in enumerate(rows, 1):
+            bucket.append(item)
+            if bucket_nr < bucket_count and row_nr >= int(bucket_nr * every):
+                yield bucket
+                bucket, bucket_nr = [], bucket_nr + 1
+        if bucket:
+            yield bucket
+
+    def get_values(self, row):
+        return [float(row[i] or 0) for i in self.data_indexes]
+
+
+class LttbDownsampler(Downsampler):
+    """
+    Largest-Triangle-Three-Buckets, the triangle areas of all data fields
+    are summed up to select one shared row per bucket.
+    """
+    def reduce(self, rows, count):
+        rows = enumerate(rows)
+        first = next(rows, None)
+        if first is None:  # Rows deleted while streaming
+            return
+        yield first[1]
+
+        previous = (first[0], self.get_values(first[1]))
+        buckets = self.get_buckets(rows, count - 1, self.threshold - 2)
+        bucket = next(buckets, None)
+        if bucket is None:
+            return
+        for next_bucket in buckets:
+            selected = self.select(previous, bucket, self.average(next_bucket))
+            yield selected[1]
+            previous = (selected[0], self.get_values(selected[1]))
+            bucket = next_bucket
+
+        last = bucket.pop()
+        if bucket:
+            following = (last[0], self.get_values(last[1]))
+            yield self.select(previous, bucket, following)[1]
+        yield last[1]
+
+    def average(self, bucket):
+        x = sum(index for index, _ in bucket) / len(bucket)
+        values = [self.get_values(row) for _, row in bucket]
+        return x, [sum(column) / len(bucket) for column in zip(*values)]
+
+    def select(self, previous, bucket, following):
+        ax, a_values = previous
+        cx, c_values = following
+        if numpy is not None:
+            return bucket[self.select_numpy(ax, a_values, cx, c_values, bucket)]
+        best, best_area = bucket[0], -1
+        for index, row in bucket:
+            area = 0
+            for ay, by, cy in zip(a_values, self.get_values(row), c_values):
+                area += abs((ax - cx) * (by - ay) - (ax - index) * (cy - ay))
+            if area > best_area:
+                best, best_area = (index, row), area
+        return best
+
+    def select_numpy(self, ax, a_values, cx, c_values, bucket):
+        xs = numpy.array([index for index, _ in bucket], dtype=float)
+        ys = numpy.array([self.get_values(row) for _, row in bucket],
+                         dtype=float).reshape(len(bucket), -1)
+        ay = numpy.array(a_values, dtype=float)
+        cy = numpy.array(c_values, dtype=float)
+        areas = numpy.abs(
+            (ax - cx) * (ys - ay) - (ax - xs)[:, None] * (cy - ay)
+        ).sum(axis=1)
+        return int(areas.argmax())
+
+
+class MinMaxDownsampler(Downsampler):
+    """
+    Two rows per bucket holding the extremes of every data field, in the
+    order they occurred, labelled with the first and last row of the bucket.
+    """
+    def reduce(self, rows, count):
+        for bucket in self.get_buckets(enumerate(rows), count,
+                                       self.threshold // 2):
+            first, last = [*bucket[0][1]], [*bucket[-1][1]]
+            for i, column in zip(self.data_indexes, zip(*(
+                    self.get_values(row) for _, row in bucket))):
+                low = min(range(len(column)), key=column.__getitem__)
+                high = max(range(len(column)), key=column.__getitem__)
+                first_nr, last_nr = sorted((low, high))
+                first[i] = bucket[first_nr][1][i]
+                last[i] = bucket[last_nr][1][i]
+            yield tuple(first)
+            if len(bucket) > 1:
+                yield tuple(last)
+
+
 class ChartDatasets:
     dataset_options = DATASET_OPTIONS
+    # Data columns as float arrays, encoded without per value conversion
+    typed_arrays = False
+    # Data columns as base64 typed arrays (compact payload)
+    typed_payload = False
     data_fields: Iterable[ViewsetModelField]
 
-    @property
+    @cached_property
     def values_list(self):
-        return self.get_values_list(self.queryset, self.fields)
+        """
+        The only query of a chart, every column is read from its result.
+        """
+        bucket_lookup = self.get_bucket_lookup()
+        if bucket_lookup is not None:
+            return [*self.get_bucketed_values_list(
+                self.queryset, self.column_fields, bucket_lookup)]
+        values_list = self.get_values_list(self.queryset, self.column_fields)
+        downsampler = self.get_downsampler()
+        if downsampler is None:
+            return [*values_list[:self.max_data_points]]
+        return downsampler.downsample(values_list)
+
+    def get_downsampler(self):
+        return None
+
+    def get_bucket_lookup(self):
+        return None
+
+    @property
+    def column_fields(self):
+        return [self.label_field, *self.data_fields]
+
+    @cached_property
+    def columns(self):
+        names = [field.name for field in self.column_fields]
+        columns = [*zip(*self.values_list)] or [() for _ in names]
+        return OrderedDict(zip(names, columns))
 
     @property
     def data(self):
@@ -55,22 +308,38 @@ class ChartDatasets:
 
     def get_values_list(self, queryset, fields):
         names = [field.name for field in fields]
-        return queryset.values_list(*names, named=True)
+        return queryset.values_list(*names)
+
+    def get_bucketed_values_list(self, queryset, fields, bucket_lookup):
+        """
+        Groups by the truncated label field and aggregates the data fields.
+        """
+        label_field, *data_fields = fields
+        bucket = f'{label_field.name}__{bucket_lookup}'
+        func = self.bucket_aggregate
+        aggregates = {f'{field.name}__{func.name.lower()}': func(field.name)
+                      for field in data_fields}
+        qs = queryset.order_by().values(bucket).annotate(**aggregates)
+        return qs.order_by(bucket).values_list(bucket, *aggregates)
 
     def get_dataset(self, field):
-        return Dataset(field)
+        column = self.columns[field.name]
+        if self.typed_arrays and numpy is not None:
+            column = numpy.array(column, dtype=float)  # None = NaN = null
+        if self.typed_payload:
+            return TypedDataset(field, column)
+        return Dataset(field, column)
 
     def get_datasets(self):
         for field in self.data_fields:
-            data = (getattr(x, field.name) for x in self.values_list)
-            yield Dataset(field, data)
+            yield self.get_dataset(field)
 
     @property
     def labels(self):
         return self.get_labels()
 
     def get_labels(self):
-        return [str(x[0]) for x in self.values_list]
+        return [str(x) for x in self.columns[self.label_field.name]]
 
 
 class ChartBase(ChartDatasets):
@@ -89,27 +358,67 @@ class ChartBase(ChartDatasets):
         },
     }
     max_data_points = 1000
+    downsampler_class = LttbDownsampler
 
-    def __init__(self, queryset, fields, chart_id, url_names):
+    # Group date/datetime labels into automatically sized buckets
+    time_bucketing = True
+    bucket_lookups = BUCKET_LOOKUPS
+    bucket_aggregate = Avg
+
+    def __init__(self, queryset, fields, chart_id, url_names,
+                 label_field=None):
         super().__init__()
         assert fields is not None
         #self.field_names = field_names
         #self.fields = self.get_fields(queryset, field_names)
         self.fields = fields
-        self.label_field = self.get_label_field()
+        self.label_field = self.get_label_field(label_field)
         self.data_fields = self.get_data_fields()
 
         self.chart_id = chart_id
         self.url = url_names['chart']
 
-        self.queryset = queryset[:self.max_data_points]
-
+        self.queryset = queryset
 
     @staticmethod
     def get_fields(queryset, field_names):
         return ViewsetModelField.get_queryset_fields(queryset, field_names)
 
-    def get_label_field(self):
+    def get_downsampler(self):
+        if self.downsampler_class is None:
+            return None
+        data_indexes = [*range(1, len(self.data_fields) + 1)]
+        return self.downsampler_class(self.max_data_points, data_indexes)
+
+    def get_bucket_lookup(self):
+        """
+        Finest registered trunc lookup that keeps the filtered date range
+        within max_data_points buckets.
+        """
+        model_field = self.label_field.model_field
+        is_date = isinstance(model_field, (DateTimeField, DateField))
+        if not self.time_bucketing or not is_date \
+                or self.queryset.query.group_by:
+            return None
+
+        name = self.label_field.name
+        stats = self.queryset.order_by().aggregate(
+            count=Count('pk'), first=Min(name), last=Max(name))
+        if stats['count'] <= self.max_data_points or stats['first'] is None:
+            return None
+
+        span = stats['last'] - stats['first']
+        registered = model_field.get_lookups()
+        for lookup, duration in self.bucket_lookups:
+            if lookup in registered \
+                    and span // duration + 2 <= self.max_data_points:
+                return lookup
+        return None
+
+    def get_label_field(self, name=None):
+        for field in self.fields:
+            if field.name == name:
+                return field
         return [*self.fields][0]
 
     def get_data_fields(self):
@@ -0,0 +1,102 @@
+import csv
+from itertools import islice
+
+from django.db.models import DurationField, JSONField
+from django.utils.duration import duration_iso_string
+
+
+__all__ = ['CsvExporter', 'NdjsonExporter', 'EXPORTERS']
+
+
+class Echo:
+    """
+    File-like object for csv.writer, returns the line instead of writing it.
+    """
+    def write(self, value):
+        return value
+
+
+class Exporter:
+    """
+    Streams the visible table columns of the table queryset.
+    Rows are read as tuples through a database cursor, so memory does not
+    depend on the number of rows.
+    """
+    content_type = None
+    extension = None
+    chunk_size = 2000
+
+    def __init__(self, table, dumps):
+        self.table = table
+        self.dumps = dumps
+        self.columns = [column for column in table.columns
+                        if getattr(column, 'viewset_field', None)
+                        and column.visible]
+        self.names = [column.name for column in self.columns]
+
+    def get_rows(self):
+        values_list = self.table.queryset.values_list(*self.names)
+        return values_list.iterator(chunk_size=self.chunk_size)
+
+    def get_chunks(self):
+        rows = self.get_rows()
+        return iter(lambda: [*islice(rows, self.chunk_size)], [])
+
+    def get_filename(self, name):
+        return f'{name}.{self.extension}'
+
+    def __iter__(self):
+        raise NotImplementedError
+
+
+class CsvExporter(Exporter):
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    def __iter__(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow([str(column) for column in self.columns])
+        encoders = self.get_encoders()
+        for chunk in self.get_chunks():
+            if any(encoders):
+                chunk = [[value if encode is None or value is None
+                          else encode(value)
+                          for encode, value in zip(encoders, row)]
+                         for row in chunk]
+            yield ''.join([writer.writerow(row) for row in chunk])
+
+    def get_encoders(self):
+        """
+        Per column: how to encode values csv.writer would write as Python
+        repr, the same way as the JSON responses. None for the others.
+        """
+        encoders = []
+        for column in self.columns:
+            if isinstance(column.model_field, JSONField):
+                encoders.append(self.encode_json)
+            elif isinstance(column.model_field, DurationField):
+                encoders.append(duration_iso_string)
+            else:
+                encoders.append(None)
+        return encoders
+
+    def encode_json(self, value):
+        return self.dumps(value).decode()
+
+
+class NdjsonExporter(Exporter):
+    content_type = 'application/x-ndjson'
+    extension = 'ndjson'
+
+    def __iter__(self):
+        names = self.names
+        dumps = self.dumps
+        for chunk in self.get_chunks():
+            yield b''.join([dumps(dict(zip(names, row))) + b'\n'
+                            for row in chunk])
+
+
+EXPORTERS = {
+    'csv': CsvExporter,
+    'ndjson': NdjsonExporter,
+}
@@ -63,10 +63,11 @@ class ViewsetModelField:
         self.queryset           = qs
         self.model_field        = model_field
         self.form_field         = model_field.formfield()
-        self.main_color         = self.get_color().rgb_str
-        self.boder_color        = self.get_color().rgb_str
-        self.background_color   = self.get_color().rgb_str
-        self.color              = self.get_color().rgb_str
+        color                   = self.get_color().rgb_str
+        self.main_color         = color
+        self.boder_color        = color
+        self.background_color   = color
+        self.color              = color
         self.verbose_name       = self.get_verbose_name()
         self.group_by           = qs.query.group_by
 
@@ -8,11 +8,27 @@ from django.http.request import HttpRequest
 
 class GroupByForm(forms.Form):
     group_by = forms.ChoiceField(label=_('Gruppieren nach'), required=False)
+    aggregates = forms.MultipleChoiceField(
+        label=_('Aggregate'), required=False)
+    aggregate_fields = forms.MultipleChoiceField(
+        label=_('Aggregierte Felder'), required=False)
 
-    def __init__(self, request, lookups):
+    def __init__(self, request, lookups, aggregates=(), aggregate_fields=(),
+                 defaults=None):
+        """
+        defaults: aggregates and aggregate_fields used if the request has
+        no group by parameters at all. A submitted form without aggregates
+        (all deselected) keeps them empty.
+        """
         assert isinstance(request, HttpRequest)
-        super().__init__(request.GET)
+        data = request.GET.copy()
+        if not any(name in data for name in self.base_fields):
+            for name, values in (defaults or {}).items():
+                data.setlist(name, values)
+        super().__init__(data)
         self.fields['group_by'].choices = self.get_group_by_choices(lookups)
+        self.fields['aggregates'].choices = aggregates
+        self.fields['aggregate_fields'].choices = aggregate_fields
 
     def get_group_by_choices(self, lookups):
         choices = [['', _('Bitte auswählen')]]
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.urls import get_resolver
+
+from ...rollups import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dirty buckets (or with --full all) of the rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Rollup keys or parts of them, default: all rollups',
+        )
+        parser.add_argument(
+            '--full',
+            help='Rebuild all buckets, e.g. after QuerySet.update()',
+            action='store_true',
+            dest='full',
+        )
+
+    def handle(self, *, names, full, **options):
+        get_resolver().url_patterns  # Viewsets register their rollups
+        for rollup in rollups:
+            if names and not any(name in rollup.key for name in names):
+                continue
+            if full:
+                summaries = rollup.rebuild()
+            else:
+                summaries = rollup.get_summaries()
+            self.stdout.write(f'{rollup.key}: {len(summaries)} buckets')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.urls import get_resolver
+
+from ...search import search_indexes
+
+
+class Command(BaseCommand):
+    help = 'Create and fill the search indexes kept by the library'
+
+    def handle(self, **options):
+        get_resolver().url_patterns  # Viewsets register their indexes
+        for search_index in search_indexes:
+            search_index.rebuild()
+            self.stdout.write(f'{search_index.model._meta.label}: '
+                              f'{search_index.__class__.__name__}')
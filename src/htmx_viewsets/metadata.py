@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+from django.utils.functional import cached_property
+
+from .table.action import UrlTemplates
+
+
+__all__ = ['ViewsetMetadata']
+
+
+class ViewsetMetadata:
+    """
+    Everything that can be derived from the viewset class alone.
+    Built once per viewset class and shared by all requests.
+    """
+    # Grouped field sets kept, least recently used ones are dropped
+    grouped_fields_maxsize = 128
+
+    def __init__(self, viewset_class):
+        self.viewset_class = viewset_class
+        viewset_class.register_lookups()
+
+        qs = viewset_class.base_queryset
+        self.fields = self.get_fields(viewset_class, qs)
+        self.lookups = self.get_lookups(self.fields)
+        self.group_by_lookups = self.get_lookups(
+            self.fields, only_groupable=True)
+        self.aggregate_choices = viewset_class.get_aggregate_choices()
+        self.aggregate_field_choices = \
+            viewset_class.get_aggregate_field_choices(qs)
+        self.grouped_fields = OrderedDict()
+        self.grouped_fields_lock = threading.Lock()
+
+    @cached_property
+    def url_templates(self):
+        return UrlTemplates(self.viewset_class.url_names)
+
+    @cached_property
+    def result_cache(self):
+        return self.viewset_class.get_result_cache()
+
+    @cached_property
+    def single_flight(self):
+        single_flight_class = self.viewset_class.single_flight_class
+        return single_flight_class() if single_flight_class else None
+
+    @cached_property
+    def search_index(self):
+        return self.viewset_class.get_search_index()
+
+    @cached_property
+    def rollups(self):
+        return {rollup.lookup: rollup
+                for rollup in self.viewset_class.get_rollups()}
+
+    @staticmethod
+    def get_fields(viewset_class, qs):
+        fields = [
+            *viewset_class.get_annotated_fields(qs),
+            *viewset_class.get_model_fields(qs),
+        ]
+        return viewset_class.filter_fields(fields)
+
+    @staticmethod
+    def get_lookups(fields, only_groupable=False):
+        lookups = []
+        for field in fields:
+            lookups += field.get_lookups(only_groupable=only_groupable)
+        return lookups
+
+    def get_grouped_fields(self, key, build):
+        """
+        Fields of grouped querysets only depend on the group by lookup and
+        the selected aggregates. The queryset of the request that built them
+        isn't kept. Shared by the threads of the process, hence the lock.
+        """
+        with self.grouped_fields_lock:
+            if key in self.grouped_fields:
+                self.grouped_fields.move_to_end(key)
+                return self.grouped_fields[key]
+        fields = build()
+        for field in fields:
+            field.queryset = None
+        with self.grouped_fields_lock:
+            self.grouped_fields[key] = fields
+            while len(self.grouped_fields) > self.grouped_fields_maxsize:
+                self.grouped_fields.popitem(last=False)
+        return fields
@@ -0,0 +1,252 @@
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+
+from django.core.cache import caches
+from django.db import connections
+
+
+__all__ = ['ResultCache', 'SingleFlight', 'CacheSingleFlight', 'TableDraws',
+           'PageCache', 'get_query_state']
+
+
+logger = logging.getLogger(__name__)
+
+
+# Parameters that change on every request without changing the data
+IGNORED_PARAMS = ('draw', '_')
+
+
+def get_query_state(request, ignored=IGNORED_PARAMS):
+    """
+    Sorted (key, value) pairs of the GET and POST parameters.
+    """
+    return sorted((key, value)
+                  for data in (request.GET, request.POST)
+                  for key, values in data.lists() if key not in ignored
+                  for value in values)
+
+
+def get_state_key(name, kind, state, versions):
+    key = md5(f'{kind}:{state}:{versions}'.encode()).hexdigest()
+    return f'{name}:{key}'
+
+
+class ResultCache:
+    """
+    Table and chart data of one viewset in the Django cache.
+    The key holds the query state and the data versions (see versions.py),
+    so results of changed data are not found anymore.
+    Only the `max_entries` most recently used results are kept.
+    """
+    cache_alias = 'default'
+    key_prefix = 'htmx_viewsets:result'
+
+    def __init__(self, name, timeout=300, max_entries=100):
+        self.name = name
+        self.timeout = timeout
+        self.max_entries = max_entries
+
+    @property
+    def index_key(self):
+        return f'{self.key_prefix}:{self.name}:index'
+
+    def get_key(self, kind, state, versions):
+        key = get_state_key(self.name, kind, state, versions)
+        return f'{self.key_prefix}:{key}'
+
+    def get_or_set(self, kind, state, versions, build):
+        cache = caches[self.cache_alias]
+        key = self.get_key(kind, state, versions)
+        data = cache.get(key)
+        if data is None:
+            data = build()
+            cache.set(key, data, self.timeout)
+        self.touch(cache, key)
+        return data
+
+    def touch(self, cache, key):
+        """
+        Moves key to the end of the index and evicts the oldest results.
+        """
+        keys = [other for other in cache.get(self.index_key, [])
+                if other != key]
+        keys.append(key)
+        evicted, keys = keys[:-self.max_entries], keys[-self.max_entries:]
+        if evicted:
+            cache.delete_many(evicted)
+        cache.set(self.index_key, keys, None)
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key (within this process) wait for the
+    first one and share its result or exception.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, build):
+        with self.lock:
+            flight = self.flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self.flights[key] = Flight()
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self.run(key, build)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    def run(self, key, build):
+        return build()
+
+
+class CacheSingleFlight(SingleFlight):
+    """
+    Coalesces across processes too: the process holding the lock in the
+    cache builds the result and publishes it for `result_timeout` seconds,
+    the others poll for it. After `lock_timeout` seconds they build it
+    themselves.
+    """
+    cache_alias = 'default'
+    key_prefix = 'htmx_viewsets:flight'
+    lock_timeout = 30
+    result_timeout = 10
+    poll_interval = 0.05
+
+    def run(self, key, build):
+        cache = caches[self.cache_alias]
+        lock_key = f'{self.key_prefix}:{key}:lock'
+        result_key = f'{self.key_prefix}:{key}:result'
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            result = cache.get(result_key)
+            if result is not None:
+                return result
+            if cache.add(lock_key, True, self.lock_timeout):
+                try:
+                    result = build()
+                    cache.set(result_key, result, self.result_timeout)
+                    return result
+                finally:
+                    cache.delete(lock_key)
+            if time.monotonic() > deadline:
+                return build()
+            time.sleep(self.poll_interval)
+
+
+class TableDraws:
+    """
+    Latest DataTables draw counter of every table client (one table in one
+    page load). Requests with an older draw were aborted by the client and
+    don't need to be answered.
+    """
+    cache_alias = 'default'
+    key_prefix = 'htmx_viewsets:draw'
+    timeout = 300
+
+    def get_key(self, client):
+        return f'{self.key_prefix}:{client}'
+
+    def register(self, client, draw):
+        cache = caches[self.cache_alias]
+        key = self.get_key(client)
+        if draw > cache.get(key, -1):
+            cache.set(key, draw, self.timeout)
+
+    def is_superseded(self, client, draw):
+        return caches[self.cache_alias].get(self.get_key(client), draw) > draw
+
+
+class PageCache:
+    """
+    Table pages prefetched in a background thread after the page before
+    was served, kept for `timeout` seconds. The key holds the query state
+    of the next request (with its start and keyset cursor) and the data
+    versions.
+    Hits and misses are counted per viewset, see get_stats().
+    Failed prefetches are logged, the page is then loaded by its request.
+    """
+    cache_alias = 'default'
+    key_prefix = 'htmx_viewsets:page'
+    timeout = 30
+    max_pending = 20  # More prefetches at once are skipped
+    executor = ThreadPoolExecutor(max_workers=2,
+                                  thread_name_prefix='htmx_viewsets_page')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def get_key(self, name, state, versions):
+        key = get_state_key(name, 'page', state, versions)
+        return f'{self.key_prefix}:{key}'
+
+    def get_stats_key(self, name, stat):
+        return f'{self.key_prefix}:{name}:{stat}'
+
+    def get(self, name, state, versions):
+        cache = caches[self.cache_alias]
+        data = cache.get(self.get_key(name, state, versions))
+        self.count(cache, name, 'misses' if data is None else 'hits')
+        return data
+
+    def prefetch(self, name, state, versions, build):
+        """
+        Runs build() in the background unless the page is cached or
+        prefetched already, or too many prefetches are pending.
+        """
+        key = self.get_key(name, state, versions)
+        with self.lock:
+            if key in self.pending or len(self.pending) >= self.max_pending:
+                return None
+            self.pending.add(key)
+        if caches[self.cache_alias].get(key) is not None:
+            self.pending.discard(key)
+            return None
+        return self.executor.submit(self.run, name, key, build)
+
+    def run(self, name, key, build):
+        cache = caches[self.cache_alias]
+        try:
+            cache.set(key, build(), self.timeout)
+            self.count(cache, name, 'prefetches')
+        except Exception:
+            logger.exception('Prefetching a page of %s failed', name)
+        finally:
+            self.pending.discard(key)
+            connections.close_all()  # Of this worker thread
+
+    def count(self, cache, name, stat):
+        key = self.get_stats_key(name, stat)
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+    def get_stats(self, name):
+        cache = caches[self.cache_alias]
+        stats = {stat: cache.get(self.get_stats_key(name, stat), 0)
+                 for stat in ('hits', 'misses', 'prefetches')}
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / requests if requests else None
+        return stats
@@ -0,0 +1,346 @@
+import time
+from collections import defaultdict
+from functools import partial
+from hashlib import md5
+
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.db.models import Avg, CharField, Count, F, Max, Min, Q,\
+    QuerySet, Sum
+from django.db.models.functions import Cast
+from django.db.models.query import FlatValuesListIterable, ValuesIterable,\
+    ValuesListIterable
+
+
+__all__ = ['Rollup', 'RollupQuerySet', 'rollups']
+
+
+BUCKET = 'rollup_bucket'
+
+
+def get_bucket_expression(lookup):
+    """
+    Bucket as text, made by the database: filtering by bucket values
+    doesn't match on every backend (e.g. truncated datetimes on SQLite).
+    """
+    return Cast(F(lookup), output_field=CharField())
+
+
+class Rollup:
+    """
+    Summary rows of a queryset grouped by `lookup`: the row count and the
+    avg, sum, min and max of each field per bucket, computed by the
+    database and kept in the Django cache, one key per bucket.
+    Changed rows mark their old and new buckets dirty (signals connected in
+    apps.py), the next read recomputes only those buckets.
+    Summaries are stored by the text of the bucket, see
+    get_bucket_expression.
+    The cache must be shared by all workers: with a per-process cache
+    (e.g. LocMemCache) the other workers don't see the dirty buckets and
+    answer from stale summaries. QuerySet.update() and bulk_create() don't
+    send signals, run the rebuild_rollups command with --full after them.
+    """
+    cache_alias = 'default'
+    key_prefix = 'htmx_viewsets:rollup'
+    # Aggregates of grouped querysets a rollup answers
+    functions = {
+        'avg':      Avg,
+        'sum':      Sum,
+        'min':      Min,
+        'max':      Max,
+    }
+    # More dirty marks than this since the last read rebuild all buckets
+    max_marks = 1000
+
+    def __init__(self, name, queryset, lookup, fields):
+        self.name = name
+        self.queryset = queryset
+        self.lookup = lookup
+        self.fields = [*fields]
+
+    @property
+    def model(self):
+        return self.queryset.model
+
+    @property
+    def key(self):
+        return f'{self.key_prefix}:{self.name}:{self.lookup}'
+
+    @property
+    def counter_key(self):
+        return f'{self.key}:dirty'
+
+    def get_dirty_key(self, index):
+        return f'{self.counter_key}:{index}'
+
+    def get_bucket_key(self, bucket):
+        return f'{self.key}:{md5(repr(bucket).encode()).hexdigest()}'
+
+    @property
+    def names(self):
+        """
+        Annotations of grouped querysets that can be read from the rollup.
+        """
+        return {'pk__count', *(f'{field}__{name}' for field in self.fields
+                               for name in self.functions)}
+
+    def get_annotations(self):
+        annotations = {'pk__count': Count('pk')}
+        for field in self.fields:
+            for name, func in self.functions.items():
+                annotations[f'{field}__{name}'] = func(field)
+        return annotations
+
+    def compute(self, buckets=None):
+        """
+        Summaries by bucket, of all buckets or only of the given ones.
+        """
+        qs = self.queryset.order_by().annotate(
+            **{BUCKET: get_bucket_expression(self.lookup)})
+        if buckets is not None:
+            query = Q(**{f'{BUCKET}__in': [
+                bucket for bucket in buckets if bucket is not None]})
+            if None in buckets:
+                query |= Q(**{f'{BUCKET}__isnull': True})
+            qs = qs.filter(query)
+        rows = qs.values(BUCKET, self.lookup).annotate(
+            **self.get_annotations())
+        return {row.pop(BUCKET): row for row in rows}
+
+    def get_index(self):
+        """
+        Number of the last dirty mark. A new counter starts at the time in
+        ns, far beyond the marks of a counter evicted before.
+        """
+        cache = caches[self.cache_alias]
+        index = cache.get(self.counter_key)
+        if index is None:
+            cache.add(self.counter_key, time.time_ns(), None)
+            index = cache.get(self.counter_key)
+        return index
+
+    def get_summaries(self):
+        """
+        Summaries of all buckets with the dirty ones recomputed.
+        """
+        cache = caches[self.cache_alias]
+        state = cache.get(self.key)
+        index = self.get_index()
+        if state is None or index is None \
+                or not 0 <= index - state['index'] <= self.max_marks:
+            return self.rebuild(index)  # Evicted or a new counter
+
+        keys = [self.get_dirty_key(dirty)
+                for dirty in range(state['index'] + 1, index + 1)]
+        marks = cache.get_many(keys)
+        if len(marks) < len(keys):  # Evicted or not written yet
+            return self.rebuild(index)
+        dirty = {bucket for mark in marks.values() for bucket in mark}
+        summaries = self.read([bucket for bucket in state['buckets']
+                               if bucket not in dirty])
+        if summaries is None:
+            return self.rebuild(index)
+        if not keys:
+            return summaries
+
+        computed = self.compute(dirty)
+        summaries.update(computed)
+        self.store(index, summaries, computed,
+                   [bucket for bucket in dirty if bucket not in computed])
+        cache.delete_many(keys)
+        return summaries
+
+    def read(self, buckets):
+        """
+        Stored summaries of the buckets, None if one was evicted.
+        """
+        keys = {self.get_bucket_key(bucket): bucket for bucket in buckets}
+        summaries = caches[self.cache_alias].get_many(keys)
+        if len(summaries) < len(keys):
+            return None
+        return {bucket: summaries[key] for key, bucket in keys.items()}
+
+    def store(self, index, summaries, changed, removed=()):
+        cache = caches[self.cache_alias]
+        cache.set_many({self.get_bucket_key(bucket): summary
+                        for bucket, summary in changed.items()}, None)
+        cache.set(self.key, {'index': index, 'buckets': [*summaries]}, None)
+        cache.delete_many([self.get_bucket_key(bucket) for bucket in removed])
+
+    def rebuild(self, index=None):
+        if index is None:
+            index = self.get_index()
+        state = caches[self.cache_alias].get(self.key)
+        summaries = self.compute()
+        removed = [bucket for bucket in state['buckets']
+                   if bucket not in summaries] if state else []
+        self.store(index, summaries, summaries, removed)
+        return summaries
+
+    def mark_dirty(self, buckets):
+        cache = caches[self.cache_alias]
+        cache.add(self.counter_key, time.time_ns(), None)
+        index = cache.incr(self.counter_key)
+        cache.set(self.get_dirty_key(index), [*buckets], None)
+
+    def get_rows(self, names):
+        """
+        Rows of the grouped queryset as dicts with the names.
+        """
+        return [{self.lookup: summary[self.lookup],
+                 **{name: summary[name] for name in names}}
+                for summary in self.get_summaries().values()]
+
+
+class RollupRegistry:
+    """
+    Rollups by model, their buckets are marked dirty by the model signals.
+    """
+    def __init__(self):
+        self.rollups = defaultdict(dict)
+
+    def register(self, rollup):
+        self.rollups[rollup.model][rollup.key] = rollup
+
+    def get(self, model):
+        return [*self.rollups.get(model, {}).values()]
+
+    def __iter__(self):
+        for model_rollups in self.rollups.values():
+            yield from model_rollups.values()
+
+    @staticmethod
+    def get_buckets(model, pk, lookups):
+        """
+        Current buckets of the row by lookup, empty if there is no row.
+        """
+        buckets = {f'{BUCKET}_{index}': get_bucket_expression(lookup)
+                   for index, lookup in enumerate(lookups)}
+        rows = model._base_manager.filter(pk=pk).annotate(**buckets)
+        for row in rows.values_list(*buckets):
+            return dict(zip(lookups, row))
+        return {}
+
+    def before_change(self, sender, instance, **kwargs):
+        model_rollups = self.get(sender)
+        if not model_rollups or instance._state.adding:
+            return
+        lookups = [*{rollup.lookup for rollup in model_rollups}]
+        instance._rollup_buckets = self.get_buckets(
+            sender, instance.pk, lookups)
+
+    def after_change(self, sender, instance, **kwargs):
+        model_rollups = self.get(sender)
+        if not model_rollups:
+            return
+        lookups = [*{rollup.lookup for rollup in model_rollups}]
+        before = instance.__dict__.pop('_rollup_buckets', {})
+        after = self.get_buckets(sender, instance.pk, lookups) \
+            if 'created' in kwargs else {}  # post_save
+        dirty = {lookup: {*(buckets[lookup] for buckets in (before, after)
+                            if lookup in buckets)}
+                 for lookup in lookups}
+        transaction.on_commit(
+            partial(self.mark_dirty, model_rollups, dirty),
+            using=router.db_for_write(sender))
+
+    @staticmethod
+    def mark_dirty(model_rollups, dirty):
+        for rollup in model_rollups:
+            if dirty[rollup.lookup]:
+                rollup.mark_dirty(dirty[rollup.lookup])
+
+
+rollups = RollupRegistry()
+
+
+ITERABLE_CLASSES = (ValuesIterable, ValuesListIterable, FlatValuesListIterable)
+
+
+def get_sort_key(name, nulls_largest):
+    """
+    Sorts NULL like the database does.
+    """
+    null = (1 if nulls_largest else -1, 0)
+    return lambda row: null if row[name] is None else (0, row[name])
+
+
+class RollupQuerySet(QuerySet):
+    """
+    Grouped queryset that reads its rows from a rollup as long as it is
+    neither filtered (e.g. by the table search) nor asks for aggregates
+    the rollup doesn't hold. Otherwise it queries the database.
+    """
+    rollup = None
+
+    @classmethod
+    def from_queryset(cls, queryset, rollup):
+        clone = queryset._chain()
+        clone.__class__ = cls
+        clone.rollup = rollup
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.rollup = self.rollup
+        return clone
+
+    @property
+    def names(self):
+        """
+        Names of the row values, in the order of ValuesListIterable.
+        Transforms like datetime__trunc_day are annotations.
+        """
+        query = self.query
+        if self._fields:
+            return [*self._fields, *(name for name in query.annotation_select
+                                     if name not in self._fields)]
+        return [*query.values_select, *query.annotation_select]
+
+    @property
+    def is_rollup(self):
+        query = self.query
+        names = set(self.names)
+        ordering = [name.lstrip('-') for name in query.order_by
+                    if isinstance(name, str)]
+        return (self.rollup is not None
+                and self._iterable_class in ITERABLE_CLASSES
+                and self.rollup.lookup in names
+                and names - {self.rollup.lookup} <= self.rollup.names
+                and query.where == self.rollup.queryset.query.where
+                and not query.distinct and not query.extra_select
+                and query.combinator is None
+                and len(ordering) == len(query.order_by)
+                and set(ordering) <= names)
+
+    def get_rollup_rows(self):
+        query = self.query
+        names = self.names
+        rows = self.rollup.get_rows(
+            [name for name in names if name != self.rollup.lookup])
+        nulls_largest = connections[self.db].features.nulls_order_largest
+        for name in reversed(query.order_by):
+            rows.sort(key=get_sort_key(name.lstrip('-'), nulls_largest),
+                      reverse=name.startswith('-'))
+        rows = rows[query.low_mark:query.high_mark]
+        if self._iterable_class is ValuesIterable:
+            return [{name: row[name] for name in names} for row in rows]
+        if self._iterable_class is FlatValuesListIterable:
+            return [row[names[0]] for row in rows]
+        return [tuple(row[name] for name in names) for row in rows]
+
+    def _fetch_all(self):
+        if self._result_cache is None and self.is_rollup:
+            self._result_cache = self.get_rollup_rows()
+        super()._fetch_all()
+
+    def _iterator(self, *args, **kwargs):
+        if self.is_rollup:
+            yield from self.get_rollup_rows()
+        else:
+            yield from super()._iterator(*args, **kwargs)
+
+    def count(self):
+        if self._result_cache is None and self.is_rollup:
+            return len(self.get_rollup_rows())
+        return super().count()
@@ -0,0 +1,243 @@
+import re
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router
+from django.db.models import BigAutoField, CharField, Q, TextField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Upper
+
+
+try:
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchQuery, SearchVector
+except ImportError:  # Only needed for the PostgreSQL indexes
+    GinIndex = SearchQuery = SearchVector = None
+
+try:
+    from django.contrib.postgres.indexes import OpClass
+except ImportError:  # Django < 4.0, no trigram expression indexes
+    OpClass = None
+
+
+__all__ = ['SearchIndex', 'PostgresFullTextIndex', 'PostgresTrigramIndex',
+           'SqliteFtsIndex', 'search_indexes']
+
+
+class SearchIndex:
+    """
+    Search of the DataTables search box over the text fields of a model,
+    by default the ones the table columns search (see Column.get_query).
+    This base class ORs an icontains per field (a sequential scan), the
+    subclasses use an index. Like the columns, digits also match the pk.
+    Querysets an index can't search (e.g. grouped ones) fall back to the
+    table columns.
+    """
+    vendor = None
+
+    def __init__(self, model, fields=None):
+        self.model = model
+        if fields is None:
+            fields = self.get_default_fields(model)
+        self.fields = [*fields]
+
+    @staticmethod
+    def get_default_fields(model):
+        return [field.name for field in model._meta.concrete_fields
+                if isinstance(field, CharField)]
+
+    @property
+    def using(self):
+        return router.db_for_read(self.model)
+
+    def supports(self, queryset, search_query):
+        vendor = connections[queryset.db].vendor
+        return queryset.model is self.model \
+            and not queryset.query.group_by and self.vendor in (None, vendor)
+
+    def search(self, queryset, search_query):
+        query = self.get_query(search_query)
+        pk_query = self.get_pk_query(search_query)
+        if pk_query is not None:
+            query |= pk_query
+        return self.prepare(queryset).filter(query)
+
+    def prepare(self, queryset):
+        return queryset
+
+    def get_query(self, search_query):
+        return reduce(or_, [Q(**{f'{field}__icontains': search_query})
+                            for field in self.fields])
+
+    def get_pk_query(self, search_query):
+        pk = self.model._meta.pk
+        if isinstance(pk, BigAutoField) and search_query.isdigit():
+            return Q(pk=int(search_query))
+        return None
+
+    def update(self, instance):
+        pass
+
+    def delete(self, instance):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class PostgresFullTextIndex(SearchIndex):
+    """
+    Prefix match of every word of the search in a tsvector of the fields.
+    get_indexes() returns the GIN expression index for Meta.indexes, the
+    query uses the same expression and is answered from it.
+    """
+    vendor = 'postgresql'
+    config = 'simple'
+
+    @classmethod
+    def get_vector(cls, fields):
+        return SearchVector(*fields, config=cls.config)
+
+    @classmethod
+    def get_indexes(cls, fields, name):
+        return [GinIndex(cls.get_vector(fields), name=name)]
+
+    @staticmethod
+    def get_terms(search_query):
+        """
+        Raw tsquery, the last word is matched as prefix while typing.
+        """
+        words = re.findall(r'\w+', search_query)
+        return ' & '.join(f"'{word}':*" for word in words)
+
+    def supports(self, queryset, search_query):
+        return super().supports(queryset, search_query) \
+            and bool(self.get_terms(search_query))
+
+    def prepare(self, queryset):
+        return queryset.alias(search_vector=self.get_vector(self.fields))
+
+    def get_query(self, search_query):
+        return Q(search_vector=SearchQuery(
+            self.get_terms(search_query), config=self.config,
+            search_type='raw'))
+
+
+class PostgresTrigramIndex(SearchIndex):
+    """
+    Same icontains as the fallback, answered from pg_trgm GIN indexes.
+    get_indexes() returns them for Meta.indexes, the migration needs
+    TrigramExtension() first. The expression indexes need Django 4.0+,
+    older versions raise ImproperlyConfigured.
+    """
+    vendor = 'postgresql'
+
+    @staticmethod
+    def get_indexes(fields, name):
+        if OpClass is None:
+            raise ImproperlyConfigured('Trigram indexes need Django 4.0+')
+        return [GinIndex(OpClass(Upper(Cast(field, TextField())),
+                                 name='gin_trgm_ops'),
+                         name=f'{name}_{field}') for field in fields]
+
+
+class SqliteFtsIndex(SearchIndex):
+    """
+    FTS5 shadow table with the trigram tokenizer: substring matches like
+    icontains, for searches of at least 3 characters.
+    The rows are kept in sync by the model signals (see apps.py) in the
+    transaction of the change. QuerySet.update() and bulk_create() don't
+    send signals, the rebuild_search_index command creates and fills the
+    table.
+    """
+    vendor = 'sqlite'
+    min_length = 3
+    is_created = False
+
+    @property
+    def table_name(self):
+        return f'{self.model._meta.db_table}_fts'
+
+    @property
+    def columns(self):
+        return [self.model._meta.get_field(field).column
+                for field in self.fields]
+
+    def exists(self):
+        if not self.is_created:
+            connection = connections[self.using]
+            self.is_created = \
+                self.table_name in connection.introspection.table_names()
+        return self.is_created
+
+    def supports(self, queryset, search_query):
+        return super().supports(queryset, search_query) \
+            and len(search_query) >= self.min_length and self.exists()
+
+    def get_query(self, search_query):
+        phrase = '"{}"'.format(search_query.replace('"', '""'))
+        sql = f'SELECT rowid FROM "{self.table_name}" ' \
+              f'WHERE "{self.table_name}" MATCH %s'
+        return Q(pk__in=RawSQL(sql, [phrase]))
+
+    def execute(self, sql, params=()):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def update(self, instance):
+        if not self.exists():
+            return
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        values = [getattr(instance, field) for field in self.fields]
+        placeholders = ', '.join(['%s'] * (len(values) + 1))
+        self.execute(f'INSERT OR REPLACE INTO "{self.table_name}" '
+                     f'(rowid, {columns}) VALUES ({placeholders})',
+                     [instance.pk, *values])
+
+    def delete(self, instance):
+        if self.exists():
+            self.execute(f'DELETE FROM "{self.table_name}" WHERE rowid = %s',
+                         [instance.pk])
+
+    def rebuild(self):
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        self.execute(f'DROP TABLE IF EXISTS "{self.table_name}"')
+        self.execute(f'CREATE VIRTUAL TABLE "{self.table_name}" '
+                     f'USING fts5({columns}, tokenize=\'trigram\')')
+        pk = self.model._meta.pk.column
+        self.execute(f'INSERT INTO "{self.table_name}" (rowid, {columns}) '
+                     f'SELECT "{pk}", {columns} '
+                     f'FROM "{self.model._meta.db_table}"')
+        self.is_created = True
+
+
+class SearchIndexRegistry:
+    """
+    Search indexes by model, updated by the model signals.
+    """
+    def __init__(self):
+        self.search_indexes = defaultdict(dict)
+
+    def register(self, search_index):
+        key = (search_index.__class__, tuple(search_index.fields))
+        self.search_indexes[search_index.model][key] = search_index
+
+    def get(self, model):
+        return [*self.search_indexes.get(model, {}).values()]
+
+    def __iter__(self):
+        for model_indexes in self.search_indexes.values():
+            yield from model_indexes.values()
+
+    def update(self, sender, instance, **kwargs):
+        for search_index in self.get(sender):
+            search_index.update(instance)
+
+    def delete(self, sender, instance, **kwargs):
+        for search_index in self.get(sender):
+            search_index.delete(instance)
+
+
+search_indexes = SearchIndexRegistry()
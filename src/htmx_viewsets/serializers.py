@@ -0,0 +1,85 @@
+import datetime
+import decimal
+import ipaddress
+import json
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http.response import HttpResponse
+from django.utils.duration import duration_iso_string
+from django.utils.functional import Promise
+
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, used for typed chart columns
+    numpy = None
+
+
+__all__ = ['JsonSerializer', 'OrjsonSerializer', 'Serializer']
+
+
+IP_ADDRESS_TYPES = (
+    ipaddress.IPv4Address,
+    ipaddress.IPv6Address,
+    ipaddress.IPv4Network,
+    ipaddress.IPv6Network,
+)
+
+
+def encode_default(value):
+    """
+    Types neither encoder handles itself.
+    """
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.timedelta):
+        return duration_iso_string(value)
+    if isinstance(value, (uuid.UUID, Promise, *IP_ADDRESS_TYPES)):
+        return str(value)
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return [None if x != x else x for x in value.tolist()]  # NaN = null
+    if numpy is not None and isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+class ViewsetJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        try:
+            return encode_default(o)
+        except TypeError:
+            return super().default(o)
+
+
+class JsonSerializer:
+    """
+    Stdlib encoder, Decimals are encoded as numbers.
+    """
+    content_type = 'application/json'
+
+    def dumps(self, data) -> bytes:
+        return json.dumps(data, cls=ViewsetJSONEncoder,
+                          separators=(',', ':')).encode()
+
+    def response(self, data) -> HttpResponse:
+        return HttpResponse(self.dumps(data), content_type=self.content_type)
+
+
+class OrjsonSerializer(JsonSerializer):
+    """
+    datetime, UUID and NumPy arrays are encoded by orjson itself.
+    """
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS \
+        if orjson is not None else 0
+
+    def dumps(self, data) -> bytes:
+        return orjson.dumps(data, default=encode_default, option=self.option)
+
+
+Serializer = JsonSerializer if orjson is None else OrjsonSerializer
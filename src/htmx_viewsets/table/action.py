@@ -1,5 +1,52 @@
 from django.utils.safestring import mark_safe
-from django.urls.base import reverse
+from django.urls import NoReverseMatch
+from django.urls.base import reverse, get_script_prefix
+
+
+__all__ = ['UrlTemplates']
+
+
+PK_PLACEHOLDER = 2147483647
+
+
+class UrlTemplates:
+    """
+    Row action URLs, each reversed once with a placeholder pk.
+    Rendering a row action only substitutes the pk.
+    Built once per viewset, cached per script prefix.
+    URLs that don't take an int pk (e.g. <uuid:pk>) are reversed per row.
+    """
+    def __init__(self, url_names):
+        self.url_names = url_names
+        self.templates = {}
+
+    def __getitem__(self, code):
+        key = (get_script_prefix(), code)
+        if key not in self.templates:
+            self.templates[key] = self.get_template(self.url_names[code])
+        return self.templates[key]
+
+    @staticmethod
+    def get_template(url_name):
+        try:
+            url = reverse(url_name, kwargs={'pk': PK_PLACEHOLDER})
+        except NoReverseMatch:
+            return None
+        return url.split(str(PK_PLACEHOLDER), 1)
+
+    def get_url(self, code, pk):
+        template = self[code]
+        if template is None:
+            return reverse(self.url_names[code], kwargs={'pk': pk})
+        head, tail = template
+        return f'{head}{pk}{tail}'
+
+    @property
+    def list_url(self):
+        key = (get_script_prefix(), 'list')
+        if key not in self.templates:
+            self.templates[key] = reverse(self.url_names['list'])
+        return self.templates[key]
 
 
 class TableRowAction:
@@ -7,10 +54,10 @@ class TableRowAction:
     url_name = None
     push_url = False
 
-    def __init__(self, row, url_names):
+    def __init__(self, row, url_templates):
         self.row = row
         self.instance = row.instance
-        self.url_names = url_names
+        self.url_templates = url_templates
 
     def render(self):
         btn = f'''
@@ -26,14 +73,13 @@ class TableRowAction:
         return mark_safe(btn)
 
     def get_href(self):
-        return f'{self.get_hx_url()}?next={reverse(self.url_names["list"])}'
+        return f'{self.get_hx_url()}?next={self.url_templates.list_url}'
 
     def get_hx_push_url(self):
         return 'true' if self.push_url else 'false'
 
     def get_hx_url(self):
-        url_name = self.url_names.get(self.code, None)
-        return reverse(url_name, kwargs={'pk': self.instance.pk})
+        return self.url_templates.get_url(self.code, self.instance.pk)
 
 
 class DetailRowAction(TableRowAction):
@@ -54,7 +100,7 @@ class DeleteRowAction(TableRowAction):
         btn = f'''
         <button 
             type="button" class="btn btn-link" 
-            hx-delete="{self.get_hx_url()}?next={reverse(self.url_names['list'])}" 
+            hx-delete="{self.get_hx_url()}?next={self.url_templates.list_url}" 
             hx-push-url="{self.get_hx_push_url()}"
             hx-confirm="Are you sure?">
                 {self.name}
@@ -1,10 +1,52 @@
-from django.db.models import fields
+__all__ = ['Cell']
 
 
-__all__ = ['Cell']
+NULL_ICON = '<i class="fa-solid fa-ban text-warning"></i>'
+
+BOOLEAN_ICONS = {
+    True: '<i class="fa-solid fa-check text-success"></i>',
+    False: '<i class="fa-solid fa-xmark text-danger"></i>',
+    None: NULL_ICON,
+}
+
+MAX_LENGTH = 25
+
+
+def render_boolean(value):
+    return BOOLEAN_ICONS[value]
+
+
+def render_related(manager):
+    return ', '.join([str(x) for x in manager.all()])
+
+
+def render_string(value):
+    if value is None:
+        return NULL_ICON
+    value = str(value)
+    if len(value) > MAX_LENGTH:
+        value = value[:MAX_LENGTH] + '...'
+    return f'<span class="cell">{value}</span>'
+
+
+def render_actions(actions):
+    actions = ''.join(action.render() for action in actions)
+    return f'<div class="btn-group">{actions}</div>'
+
+
+def render_hidden(value):
+    return ''
+
+
+def get_hidden(row):
+    return None  # Hidden columns may be deferred, never touch them
 
 
 class Cell:
+    """
+    Single cell, only used where rows are rendered one by one.
+    Table pages apply the compiled column renderers directly.
+    """
     def __init__(self, row, column):
         self.row = row
         self.column = column
@@ -14,34 +56,9 @@ class Cell:
         self.verbose_name = column.viewset_field.model_field.verbose_name
 
     def render(self):
-        if isinstance(self.instance, dict):
-            value = self.instance.get(self.model_field.name)
-        else:
-            value = getattr(self.instance, self.model_field.name)
-        value = self.viewset_field.clean_value(value)
-
-        if value is None:
-            return '<i class="fa-solid fa-ban text-warning"></i>'
-
-        if isinstance(self.model_field, fields.related.ManyToManyField):
-            manager = getattr(self.instance, self.model_field.name)
-            return ', '.join([str(x) for x in manager.all()])
-
-        if isinstance(self.model_field, fields.BooleanField):
-            return {
-                True: '<i class="fa-solid fa-check text-success"></i>',
-                False: '<i class="fa-solid fa-xmark text-danger"></i>',
-                None: '<i class="fa-solid fa-question"></i>',
-            }[value]
-        
-        max_length = 25
-        value = str(value)
-        if len(value) > max_length:
-            try:
-                value = value[:max_length] + '...'
-            except TypeError:
-                pass
-        return f'<span class="cell">{value}</span>'
+        getter, renderer = self.column.compile_value(
+            isinstance(self.instance, dict))
+        return renderer(getter(self.row))
 
 
 class ActionCell(Cell):
@@ -54,5 +71,4 @@ class ActionCell(Cell):
         self.actions = self.row.actions
 
     def render(self):
-        actions = ''.join(action.render() for action in self.row.actions)
-        return f'<div class="btn-group">{actions}</div>'
+        return render_actions(self.actions)
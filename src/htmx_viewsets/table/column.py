@@ -1,14 +1,24 @@
 from abc import ABC
+from operator import attrgetter, methodcaller
 
 from django.db import models
 from django.db.models import Q
 from django.db.models.query import QuerySet
 
 from ..fields import ViewsetModelField
-from .cell import Cell, ActionCell
+from .cell import Cell, ActionCell, get_hidden, render_actions,\
+    render_boolean, render_hidden, render_related, render_string
 
 
-__all__ = ['Column']
+__all__ = ['Column', 'compile_columns']
+
+
+def compile_columns(columns, is_dict):
+    """
+    One (getter, renderer) pair per column, getters take the Row.
+    """
+    return [column.compile(is_dict) if column.visible
+            else (get_hidden, render_hidden) for column in columns]
 
 
 class ColumnBase(ABC):
@@ -16,10 +26,20 @@ class ColumnBase(ABC):
     verbose_name = ''
     cell_class = Cell
     is_pk = False
+    visible = True
 
     def get_query(self, *args):
         return {}
 
+    def compile(self, is_dict):
+        """
+        Renders every value through a cell_class instance.
+        """
+        cell_class = self.cell_class
+        def getter(row):
+            return cell_class(row, self)
+        return getter, methodcaller('render')
+
     def __str__(self):
         return str(self.verbose_name)
 
@@ -35,6 +55,32 @@ class Column(ColumnBase):
         self.name = viewset_field.name
         self.verbose_name = viewset_field.verbose_name
 
+    def compile(self, is_dict):
+        if self.cell_class is not Cell:
+            return super().compile(is_dict)  # Custom cells render themselves
+        return self.compile_value(is_dict)
+
+    def compile_value(self, is_dict):
+        """
+        (getter, renderer) of the plain value, used by Cell as well.
+        """
+        name = self.model_field.name
+        if self.model_field.many_to_many:
+            return attrgetter(f'instance.{name}'), render_related
+
+        clean = self.viewset_field.clean_value
+        if is_dict:
+            def getter(row):
+                return clean(row.instance.get(name))
+        else:
+            get = attrgetter(f'instance.{name}')
+            def getter(row):
+                return clean(get(row))
+
+        if isinstance(self.model_field, models.BooleanField):
+            return getter, render_boolean
+        return getter, render_string
+
     def get_query(self, queryset:QuerySet, search_query:str) -> Q:
         if not search_query:
             return None
@@ -60,3 +106,6 @@ class Column(ColumnBase):
 class ActionColumn(ColumnBase):
     cell_class = ActionCell
     viewset_field = None
+
+    def compile(self, is_dict):
+        return attrgetter('actions'), render_actions
@@ -0,0 +1,93 @@
+import json
+from hashlib import md5
+
+from django.core.cache import caches
+from django.db import connections
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+
+__all__ = ['Counter', 'CachedCounter', 'EstimatedCounter',
+           'CountingPaginator']
+
+
+class Counter:
+    """
+    Counts querysets once per table (= request).
+    Querysets that only differ in ordering share one result.
+    """
+    def __init__(self):
+        self.counts = {}
+
+    def count(self, queryset):
+        key = self.get_key(queryset)
+        if key not in self.counts:
+            self.counts[key] = self.get_count(queryset, key)
+        return self.counts[key]
+
+    @staticmethod
+    def get_key(queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        return md5(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+
+    def get_count(self, queryset, key):
+        return queryset.count()
+
+
+class CachedCounter(Counter):
+    """
+    Keeps counts in the Django cache for `timeout` seconds.
+    The key is the normalized count SQL of the filtered queryset.
+    """
+    cache_alias = 'default'
+    timeout = 60
+    key_prefix = 'htmx_viewsets:count'
+
+    def get_count(self, queryset, key):
+        cache = caches[self.cache_alias]
+        cache_key = f'{self.key_prefix}:{key}'
+        count = cache.get(cache_key)
+        if count is None:
+            count = super().get_count(queryset, key)
+            cache.set(cache_key, count, self.timeout)
+        return count
+
+
+class EstimatedCounter(CachedCounter):
+    """
+    Uses the row estimate of the query planner above `threshold` rows.
+    Only PostgreSQL is supported, other backends count exactly.
+    """
+    threshold = 100000
+
+    def get_count(self, queryset, key):
+        estimate = self.get_estimate(queryset)
+        if estimate is not None and estimate >= self.threshold:
+            return estimate
+        return super().get_count(queryset, key)
+
+    @staticmethod
+    def get_estimate(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator reading its count from the table counter.
+    """
+    def __init__(self, object_list, per_page, counter, **kwargs):
+        self.counter = counter
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return self.counter.count(self.object_list)
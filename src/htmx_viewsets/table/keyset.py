@@ -0,0 +1,149 @@
+import json
+import datetime
+from hashlib import md5
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, DecimalField
+
+
+__all__ = ['Keyset']
+
+
+class KeysetEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder cuts microseconds, cursors need the exact value.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetSerializer(signing.JSONSerializer):
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'),
+                          cls=KeysetEncoder).encode('latin-1')
+
+
+class Keyset:
+    """
+    Seek pagination on (order column, pk).
+
+    Every response contains a signed cursor with the first and last row and
+    the length of the page. The client sends it back with the next request:
+    the page at the cursor, or before or after it with the same length, is
+    fetched with a WHERE on the cursor values instead of an OFFSET. Any
+    other jump falls back to the offset.
+    """
+    param = 'keyset'
+    salt = 'htmx_viewsets.table.keyset'
+
+    def __init__(self, queryset, field, descending):
+        self.field = field
+        self.descending = descending
+        prefix = '-' if descending else ''
+        self.queryset = queryset.order_by(f'{prefix}{field.name}',
+                                          f'{prefix}pk')
+        sql, params = self.queryset.query.sql_with_params()
+        self.key = md5(f'{sql}:{params}'.encode()).hexdigest()
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        """
+        Returns None if the ordering of the queryset can't be seeked.
+        """
+        if queryset.query.group_by:
+            return None
+        query = queryset.query
+        ordering = query.order_by or query.get_meta().ordering or ['pk']
+        name = ordering[0]
+        if not isinstance(name, str):
+            return None
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        opts = queryset.model._meta
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.is_relation or field.null or not field.concrete:
+            return None
+        # SQLite doesn't round stored decimals, cursor values would be off
+        is_sqlite = connections[queryset.db].vendor == 'sqlite'
+        if is_sqlite and isinstance(field, DecimalField):
+            return None
+        return cls(queryset, field, descending)
+
+    def get_objects(self, queryset, request_data, start, length,
+                    chunk_size=None):
+        """
+        Returns None if the requested page is not next to the cursor.
+        The queryset must be ordered like self.queryset.
+        """
+        cursor = self.load(request_data.get(self.param))
+        if cursor is None or length < 1:
+            return None
+        if start == cursor['start']:
+            return self.seek(queryset, cursor['first'], length,
+                             inclusive=True, chunk_size=chunk_size)
+        if cursor.get('length') != length:
+            return None
+        if start == cursor['start'] + length:
+            return self.seek(queryset, cursor['last'], length,
+                             chunk_size=chunk_size)
+        if start == cursor['start'] - length and start >= 0:
+            return self.seek(queryset, cursor['first'], length,
+                             forward=False)
+        return None
+
+    def seek(self, queryset, position, length, forward=True,
+             inclusive=False, chunk_size=None):
+        """
+        Pages before the cursor are read in reverse and always loaded.
+        """
+        value, pk = position
+        ascending = forward != self.descending
+        lookup = 'gt' if ascending else 'lt'
+        pk_lookup = f'{lookup}e' if inclusive else lookup
+        query = Q(**{f'{self.field.name}__{lookup}': value}) \
+            | Q(**{self.field.name: value, f'pk__{pk_lookup}': pk})
+        qs = queryset if forward else queryset.reverse()
+        qs = qs.filter(query)[:length]
+        if not forward:
+            return [*qs][::-1]
+        if chunk_size is not None:
+            return qs.iterator(chunk_size=chunk_size)
+        return [*qs]
+
+    def get_cursor(self, start, length, objects):
+        if not objects:
+            return None
+        return signing.dumps({
+            'key': self.key,
+            'start': start,
+            'length': length,
+            'first': self.get_position(objects[0]),
+            'last': self.get_position(objects[-1]),
+        }, salt=self.salt, serializer=KeysetSerializer)
+
+    def get_position(self, instance):
+        return [self.field.value_from_object(instance), instance.pk]
+
+    def load(self, token):
+        if not token:
+            return None
+        try:
+            cursor = signing.loads(token, salt=self.salt)
+        except signing.BadSignature:
+            return None
+        if cursor.get('key') != self.key:
+            return None
+        pk_field = self.queryset.model._meta.pk
+        for name in ('first', 'last'):
+            value, pk = cursor[name]
+            cursor[name] = (self.field.to_python(value),
+                            pk_field.to_python(pk))
+        return cursor
@@ -0,0 +1,66 @@
+__all__ = ['QueryPlanner']
+
+
+class QueryPlanner:
+    """
+    Derives select_related, prefetch_related and only() for a table page
+    from the columns that are rendered (= visible).
+    `required` names fields that must be loaded anyway (e.g. for cursors).
+    """
+    def __init__(self, columns, required=()):
+        self.model_fields = [column.model_field for column in columns
+                             if getattr(column, 'viewset_field', None)
+                             and column.visible]
+        self.required = required
+
+    def plan(self, qs):
+        if qs.query.group_by or qs.query.values_select:
+            return qs  # Rows are dicts, nothing to load
+        model = qs.model
+        model_fields = self.get_model_fields(model)
+
+        select_related = self.get_select_related(model_fields)
+        if select_related:
+            qs = qs.select_related(*select_related)
+
+        prefetch_related = self.get_prefetch_related(model_fields)
+        if prefetch_related:
+            qs = qs.prefetch_related(*prefetch_related)
+
+        only = self.get_only(model, model_fields)
+        if only:
+            qs = qs.only(*only, *self.required)
+        return qs
+
+    def get_model_fields(self, model):
+        """
+        Fields of the model that are rendered, looked up by name: annotations
+        copy the output field of the expression (and its model) under their
+        own name.
+        """
+        opts = model._meta
+        fields = {field.name: field
+                  for field in (*opts.concrete_fields, *opts.many_to_many)}
+        return [fields[field.name] for field in self.model_fields
+                if field.name in fields]
+
+    @staticmethod
+    def get_select_related(model_fields):
+        return [field.name for field in model_fields if field.concrete
+                and (field.many_to_one or field.one_to_one)]
+
+    @staticmethod
+    def get_prefetch_related(model_fields):
+        return [field.name for field in model_fields if field.many_to_many]
+
+    @staticmethod
+    def get_only(model, model_fields):
+        """
+        Empty if all concrete fields are rendered anyway.
+        """
+        names = [field.name for field in model_fields
+                 if field.concrete and not field.many_to_many]
+        concrete = {field.name for field in model._meta.concrete_fields}
+        if concrete <= set(names):
+            return []
+        return [model._meta.pk.name, *names]
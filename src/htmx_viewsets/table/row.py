@@ -1,27 +1,45 @@
 from django.db.models.base import Model
+from django.utils.functional import cached_property
+
+from .column import compile_columns
 
 __all__ = ['Row']
 
 
 class Row:
-    """ this is a list of cells """
-    def __init__(self, columns, instance, url_names, row_action_classes):
+    """
+    Row of a table, `compiled` holds one (getter, renderer) per column.
+    Cells are only created if accessed.
+    """
+    def __init__(self, columns, instance, url_templates, row_action_classes,
+                 compiled=None):
         self.instance = instance
         self.columns = columns
-        self.actions = self.get_actions(row_action_classes, url_names)
-        self.cells = self.get_cells(columns)
+        self.actions = self.get_actions(row_action_classes, url_templates)
+        if compiled is None:
+            compiled = compile_columns(columns, isinstance(instance, dict))
+        self.compiled = compiled
+
+    @cached_property
+    def cells(self):
+        return self.get_cells(self.columns)
 
     def get_cells(self, columns):
         return [column.cell_class(self, column) for column in columns]
 
-    def get_actions(self, action_classes, url_names):
+    def get_actions(self, action_classes, url_templates):
         if isinstance(self.instance, dict):
             return []
-        return [cls(self, url_names) for cls in action_classes]
+        return [cls(self, url_templates) for cls in action_classes]
+
+    @property
+    def values(self):
+        return tuple(getter(self) for getter, _ in self.compiled)
 
     @property
     def data(self):
-        return [cell.render() for cell in self.cells]
+        return [render(value) for (_, render), value
+                in zip(self.compiled, self.values)]
 
     def __repr__(self):
         return 'Row:' + str(self)
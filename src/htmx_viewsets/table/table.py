@@ -1,14 +1,19 @@
 import json
-from typing import Dict
+from itertools import islice
+from typing import Dict, Optional
 
 from django.template.loader import get_template
 from django.urls.base import reverse
-from django.db.models import Q, QuerySet
-from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-from .column import Column, ActionColumn
+from .column import Column, ActionColumn, compile_columns
+from .counter import Counter, CountingPaginator
+from .planner import QueryPlanner
 from .row import Row
-from .action import DeleteRowAction, DetailRowAction, EditRowAction
+from .action import DeleteRowAction, DetailRowAction, EditRowAction,\
+    UrlTemplates
+from ..search import SearchIndex
 
 
 __all__ = ['Table']
@@ -29,12 +34,24 @@ class Table:
         [10, 50, 250, 1000],
     ])
     show_footer = False
+    counter_class = Counter
+    keyset_class = None  # Set to Keyset for seek pagination
+    planner_class = QueryPlanner
+    chunk_size = 100  # Rows fetched and encoded at once by iter_data
+    search_delay = 400  # ms after the last keystroke until the search is sent
+    # Render the first page into the list response, DataTables shows it
+    # without a request (deferLoading)
+    embed_first_page = False
 
     def __init__(self, request, qs, viewset_fields, table_id,
-                 url_names: Dict[str, str]):
+                 url_names: Dict[str, str],
+                 url_templates: Optional[UrlTemplates] = None,
+                 search_index: Optional[SearchIndex] = None):
         self.request_data = getattr(request, request.method)
 
         self.url_names = url_names
+        self.url_templates = url_templates or UrlTemplates(url_names)
+        self.search_index = search_index
         self.base_queryset = qs
 
         self.fields = viewset_fields
@@ -42,26 +59,78 @@ class Table:
         self.verbose_name = qs.model._meta.verbose_name
         self.verbose_name_plural = qs.model._meta.verbose_name_plural
 
+        self.counter = self.get_counter()
         self.queryset = self.get_qs(self.request_data, qs)
-        self.paginator = self.get_paginator(self.request_data, self.queryset)
-        self.page = self.get_page(self.request_data, self.paginator)
+        self.keyset = self.get_keyset(self.queryset)
+        if self.keyset is not None:
+            self.queryset = self.keyset.queryset
         self.columns = self.get_columns(self.queryset)
+        self.hide_columns(self.request_data, self.columns)
 
         self.row_action_classes = self.get_row_action_classes(self.columns)
 
-        first = self.page.start_index()-1
-        last = self.page.end_index()-1
-        if first >= 0 and last >= 0:
-            objects = self.queryset[first:last]
-        else:
-            objects = self.queryset.none()
-        assert isinstance(objects, QuerySet)
-        self.rows = self.get_rows(
-            self.page.object_list, self.columns, url_names, self.row_action_classes)
+    @cached_property
+    def paginator(self):
+        return self.get_paginator(self.request_data, self.queryset)
+
+    @cached_property
+    def page(self):
+        return self.get_page(self.request_data, self.paginator)
+
+    @cached_property
+    def page_queryset(self):
+        """
+        Queryset the rows are loaded from, counts use self.queryset.
+        """
+        return self.get_page_queryset(self.queryset, self.columns)
+
+    @cached_property
+    def object_list(self):
+        return [*self.get_objects()]
+
+    def get_objects(self, chunk_size=None):
+        """
+        Objects of the page, read through a cursor if chunk_size is given.
+        """
+        per_page = self.paginator.per_page
+        if self.keyset is not None:
+            objects = self.keyset.get_objects(
+                self.page_queryset, self.request_data, self.start, per_page,
+                chunk_size=chunk_size)
+            if objects is not None:
+                return objects
+        bottom = (self.page.number - 1) * per_page
+        qs = self.page_queryset[bottom:bottom + per_page]
+        if chunk_size is None:
+            return qs
+        return qs.iterator(chunk_size=chunk_size)
+
+    @cached_property
+    def rows(self):
+        return self.get_rows(self.object_list, self.columns,
+                             self.url_templates, self.row_action_classes)
+
+    @property
+    def start(self):
+        return int(self.request_data.get('start', 0))
 
     def get_fields(self, queryset):
         return self.fields
 
+    def get_counter(self):
+        return self.counter_class()
+
+    def get_page_queryset(self, qs, columns):
+        if self.planner_class is None:
+            return qs
+        required = [self.keyset.field.name] if self.keyset else []
+        return self.planner_class(columns, required).plan(qs)
+
+    def get_keyset(self, qs):
+        if self.keyset_class is None:
+            return None
+        return self.keyset_class.from_queryset(qs)
+
     def get_columns(self, qs):
         columns = []
         if self.row_action_classes and not qs.query.group_by:
@@ -70,9 +139,24 @@ class Table:
             columns.append(Column(field))
         return columns
 
-    def get_rows(self, objects, columns, url_names, row_action_classes):
-        return [Row(columns, instance, url_names, row_action_classes)
-                for instance in objects]
+    @staticmethod
+    def hide_columns(request_data, columns):
+        """
+        Columns hidden in DataTables are neither fetched nor rendered.
+        """
+        for i, column in enumerate(columns):
+            if request_data.get(f'columns[{i}][visible]') == 'false':
+                column.visible = False
+
+    def get_rows(self, objects, columns, url_templates, row_action_classes):
+        """
+        Columns are compiled once per page, not per cell.
+        """
+        if not objects:
+            return []
+        compiled = compile_columns(columns, isinstance(objects[0], dict))
+        return [Row(columns, instance, url_templates, row_action_classes,
+                    compiled) for instance in objects]
 
     def get_row_action_classes(self, columns):
         """
@@ -85,7 +169,7 @@ class Table:
 
     def get_paginator(self, request_data, result_qs):
         per_page = request_data.get('length', '10')
-        return Paginator(result_qs, int(per_page))
+        return CountingPaginator(result_qs, int(per_page), self.counter)
 
     def get_page(self, request_data, paginator):
         per_page = paginator.per_page
@@ -95,6 +179,9 @@ class Table:
 
     def filter_qs(self, request_data, qs):
         search_query = request_data.get('search[value]')
+        if search_query and self.search_index is not None \
+                and self.search_index.supports(qs, search_query):
+            return self.search_index.search(qs, search_query)
         query = Q()
         for column in self.get_columns(qs):
             column_query = column.get_query(qs, search_query)
@@ -131,18 +218,69 @@ class Table:
         base_url = reverse(self.url_names['list'])
         return f'{base_url}?{self.request_data.urlencode()}'
 
+    def get_draw(self):
+        return int(self.request_data.get('draw', 1)) + 1
+
+    def get_info(self):
+        return {
+            "draw": self.get_draw(),
+            "recordsTotal": self.counter.count(self.base_queryset),
+            "recordsFiltered": self.paginator.count,
+        }
+
     @property
     def data(self):
-        data = {
-            "draw": int(self.request_data.get('draw', 1)) + 1,
-            "recordsTotal": self.base_queryset.count(),
-            "recordsFiltered": self.queryset.count(),
-            "data": [row.data for row in self.rows],
-        }
+        data = self.get_info()
+        data['data'] = [row.data for row in self.rows]
+        if self.keyset is not None:
+            data['keyset'] = self.keyset.get_cursor(
+                self.start, self.paginator.per_page, self.object_list)
         return data
 
+    @cached_property
+    def embedded_data(self):
+        """
+        First page rendered by table.html, see embed_first_page.
+        """
+        return self.data
+
+    def iter_data(self, dumps):
+        """
+        Encoded data, the rows are fetched, rendered and encoded
+        chunk_size rows at a time. dumps encodes an object to JSON bytes.
+        The counts are queried before streaming starts, their errors still
+        get an error response.
+        """
+        head = dumps(self.get_info())[:-1] + b',"data":['
+        return self.iter_rows(dumps, head)
+
+    def iter_rows(self, dumps, head):
+        yield head
+        objects = iter(self.get_objects(self.chunk_size))
+        first = last = None
+        separator = b''
+        while True:
+            chunk = [*islice(objects, self.chunk_size)]
+            if not chunk:
+                break
+            if first is None:
+                first = chunk[0]
+            last = chunk[-1]
+            rows = self.get_rows(chunk, self.columns, self.url_templates,
+                                 self.row_action_classes)
+            yield separator + dumps([row.data for row in rows])[1:-1]
+            separator = b','
+        end = b']'
+        if self.keyset is not None:
+            ends = [first, last] if first is not None else []
+            end += b',"keyset":' + dumps(
+                self.keyset.get_cursor(self.start, self.paginator.per_page,
+                                       ends))
+        yield end + b'}'
+
     def get_row(self, instance):
-        rows = [*self.get_rows([instance], self.columns, self.url_names, self.row_action_classes)]
+        rows = [*self.get_rows([instance], self.columns, self.url_templates,
+                               self.row_action_classes)]
         return rows[0]
         for row in self.rows:
             if row.instance==instance:
@@ -0,0 +1,52 @@
+import time
+
+from django.core.cache import caches
+
+
+__all__ = ['DataVersions', 'data_versions']
+
+
+class DataVersions:
+    """
+    Per model data version (time of the last change in ns), kept in the
+    Django cache and bumped by the model signals connected in apps.py.
+    The cache must be shared by all workers, QuerySet.update() and
+    bulk_create() don't send signals and don't bump the version.
+    """
+    cache_alias = 'default'
+    key_prefix = 'htmx_viewsets:version'
+
+    def get_key(self, model):
+        return f'{self.key_prefix}:{model._meta.label_lower}'
+
+    def get_many(self, models):
+        """
+        Versions of models, unknown versions start now.
+        """
+        cache = caches[self.cache_alias]
+        keys = {self.get_key(model) for model in models}
+        versions = cache.get_many(keys)
+        missing = {key: time.time_ns() for key in keys - versions.keys()}
+        for key, version in missing.items():
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+        return [versions[key] for key in sorted(keys)]
+
+    def bump(self, model):
+        caches[self.cache_alias].set(self.get_key(model), time.time_ns(),
+                                     None)
+
+
+data_versions = DataVersions()
+
+
+def bump_version(sender, **kwargs):
+    data_versions.bump(sender)
+
+
+def bump_m2m_version(sender, instance, action, model, **kwargs):
+    if not action.startswith('post_'):
+        return
+    for changed in (sender, instance.__class__, model):
+        data_versions.bump(changed)
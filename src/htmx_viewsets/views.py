@@ -1,16 +1,25 @@
 from typing import Iterable, Optional, Dict, TYPE_CHECKING, Any, List, Callable
 from collections import OrderedDict
+from copy import copy
+from hashlib import md5
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.db import models
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
-from django.http.response import JsonResponse, HttpResponse
+from django.http.response import HttpResponse, StreamingHttpResponse,\
+    HttpResponseBadRequest
 from django.views.generic.base import ContextMixin, TemplateResponseMixin, View
 from django import forms
 from django.http.request import HttpRequest
 from django.db.models.query import QuerySet
 from django.shortcuts import redirect, reverse
+from django.utils.cache import get_conditional_response, patch_cache_control,\
+    quote_etag
+from django.utils.http import http_date
 from .chart import ChartBase
+from .serializers import Serializer, JsonSerializer
+from .export import EXPORTERS
+from .results import PageCache, TableDraws, get_query_state
 
 
 class CloseModalResponse:
@@ -36,6 +45,44 @@ class HtmxView(ContextMixin, View):
     pass
 
 
+class SerializerMixin:
+    serializer_class: JsonSerializer = Serializer
+
+    def get_serializer(self) -> JsonSerializer:
+        return self.serializer_class()
+
+    def render_json(self, data:Any) -> HttpResponse:
+        return self.get_serializer().response(data)
+
+
+class ConditionalMixin:
+    """
+    ETag and Last-Modified from the request parameters and the data
+    versions of the viewset models. GET requests for unchanged data are
+    answered with 304 before the viewset components are evaluated.
+    """
+    conditional = True
+
+    def get_etag(self, request:HttpRequest, versions:List[int]) -> str:
+        key = f'{request.path}:{get_query_state(request)}:{versions}'
+        return quote_etag(md5(key.encode()).hexdigest())
+
+    def conditional_response(self, request:HttpRequest, render:Callable[[], HttpResponse]) -> HttpResponse:
+        if not self.conditional or request.method not in ('GET', 'HEAD'):
+            return render()
+        versions = self.viewset.get_data_versions()
+        etag = self.get_etag(request, versions)
+        last_modified = max(versions) // 10 ** 9
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render()
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class ViewResponse:
     def __new__(cls, view_class:View, request:HttpRequest, method:str='get',
                 **kwargs:Optional[Any]) -> HttpResponse:
@@ -68,6 +115,12 @@ class HtmxModelView(HtmxView, TemplateResponseMixin, ContextMixin):
 
     chart_class: ChartBase
 
+    # Viewset components (table, chart) this view needs
+    components:         Iterable[str] = ()
+    # Components rendered by the template, e.g. the detail view only needs
+    # the table for its row
+    context_components: Iterable[str] = ()
+
     def __new__(cls):
         setattr(cls, 'url_names', cls.viewset_class.url_names)
         return ContextMixin.__new__(cls)
@@ -75,7 +128,7 @@ class HtmxModelView(HtmxView, TemplateResponseMixin, ContextMixin):
     def dispatch(self, request, *args, **kwargs):
         if not self.has_permission():
             return self.handle_no_permission()
-        self.viewset = self.viewset_class(request)
+        self.viewset = self.viewset_class(request, self.components)
         self.fields = self.get_fields()
         return super().dispatch(request, *args, **kwargs)
 
@@ -100,12 +153,14 @@ class HtmxModelView(HtmxView, TemplateResponseMixin, ContextMixin):
 
     def get_context_data(self, *args:Optional[Any], **kwargs:Optional[Any]) -> Dict[str, Any]:
         ctx = super().get_context_data(*args, **kwargs)
-        ctx.update(self.viewset.get_context_data())
+        ctx.update(self.viewset.get_context_data(self.context_components))
         ctx['field_values'] = self.get_field_values()
         ctx['next_url'] = self.get_next_url()
         return ctx
 
     def get_field_values(self) -> Optional[OrderedDict]:
+        if 'table' not in self.components:
+            return None
         if hasattr(self, 'object') and self.object:
             row = self.viewset.table.get_row(self.object)
             values = [(cell.verbose_name, cell.render()) for cell in row.cells]
@@ -120,6 +175,8 @@ class HtmxModelView(HtmxView, TemplateResponseMixin, ContextMixin):
 class HtmxListView(HtmxModelView, ListView):
     template_name = 'htmx_viewsets/list.html'
     code = 'list'
+    components = ('table', 'chart')
+    context_components = ('table', 'chart')
     force_full = True
     methods = ['get', 'post']
 
@@ -136,9 +193,16 @@ class HtmxListView(HtmxModelView, ListView):
                 request_get.pop(key)
 
         form = self.viewset.group_by_form
-        request_get.pop('group_by', None)
+        for name in form.base_fields:
+            request_get.pop(name, None)
         if form.is_valid():
-            request_get.update(form.cleaned_data)
+            for name, value in form.cleaned_data.items():
+                if name not in request.GET:
+                    continue  # Defaults of the form are not sent
+                if isinstance(value, list):
+                    request_get.setlist(name, value)
+                else:
+                    request_get[name] = value
 
         return redirect(f'{request.path}?{request_get.urlencode()}')
 
@@ -148,20 +212,134 @@ class HtmxListView(HtmxModelView, ListView):
         return ctx
 
 
-class HtmxTableView(HtmxModelView, ListView):
+class HtmxTableView(ConditionalMixin, SerializerMixin, HtmxModelView, ListView):
     template_name = ''
     code = 'table'
+    components = ('table',)
+    # Stream the rows from a database cursor, see Table.chunk_size
+    streaming = False
+    # Requests superseded by a newer draw of the same client are dropped
+    table_draws: Optional[TableDraws] = TableDraws()
+    client_draw = None
+    # Prefetch the next page after each response, e.g. PageCache()
+    page_cache: Optional[PageCache] = None
+
+    def get(self, request:HttpRequest, *args:Optional[Any], **kwargs:Optional[Any]) -> HttpResponse:
+        self.client_draw = self.get_client_draw(request)
+        if self.client_draw is not None:
+            self.table_draws.register(*self.client_draw)
+        if self.is_superseded():
+            return self.superseded_response()
+        return self.conditional_response(request, self.render_table)
+
+    def get_client_draw(self, request:HttpRequest) -> Optional[tuple]:
+        """
+        (client, draw) from the headers sent by table.html
+        """
+        client = request.headers.get('X-Table-Client')
+        draw = request.headers.get('X-Table-Draw', '')
+        if self.table_draws is None or not client or not draw.isdigit():
+            return None
+        return client, int(draw)
+
+    def is_superseded(self) -> bool:
+        return self.client_draw is not None \
+            and self.table_draws.is_superseded(*self.client_draw)
+
+    def superseded_response(self) -> HttpResponse:
+        response = HttpResponse(status=204)
+        patch_cache_control(response, no_store=True)
+        return response
+
+    def render_table(self) -> HttpResponse:
+        if self.is_superseded():  # Checked again before the queries
+            return self.superseded_response()
+        table = self.viewset.table
+        if self.streaming:
+            return self.stream_json(table)
+        if self.page_cache is None:
+            data = self.viewset.get_cached_data('table', lambda: table.data)
+            return self.render_json({**data, 'draw': table.get_draw()})
+
+        name = f'{self.viewset.namespace}:{self.viewset.node_id}'
+        versions = self.viewset.get_data_versions()
+        data = self.page_cache.get(
+            name, get_query_state(self.request), versions)
+        is_hit = data is not None
+        if not is_hit:
+            data = self.viewset.get_cached_data('table', lambda: table.data)
+        self.prefetch_next_page(name, data, versions)
+        response = self.render_json({**data, 'draw': table.get_draw()})
+        response['X-Page-Cache'] = 'hit' if is_hit else 'miss'
+        return response
+
+    def get_next_page_request(self, data:Dict[str, Any]) -> Optional[HttpRequest]:
+        """
+        Copy of the request the client sends for the next page, None on
+        the last page.
+        """
+        table = self.viewset.table
+        start = table.start + table.paginator.per_page
+        if start >= data['recordsFiltered']:
+            return None
+        request = copy(self.request)
+        request_data = getattr(request, request.method).copy()
+        request_data['start'] = str(start)
+        if 'keyset' in data:
+            request_data['keyset'] = data['keyset']
+        setattr(request, request.method, request_data)
+        return request
+
+    def prefetch_next_page(self, name:str, data:Dict[str, Any], versions:List) -> None:
+        request = self.get_next_page_request(data)
+        if request is None:
+            return
+        viewset_class = self.viewset_class
+        components = self.components
+
+        def build():
+            return viewset_class(request, components).table.data
+
+        self.page_cache.prefetch(
+            name, get_query_state(request), versions, build)
+
+    def stream_json(self, table:'table.Table') -> StreamingHttpResponse:
+        serializer = self.get_serializer()
+        return StreamingHttpResponse(table.iter_data(serializer.dumps),
+                                     content_type=serializer.content_type)
+
+    def post(self, request:HttpRequest, *args:Optional[Any], **kwargs:Optional[Any]) -> HttpResponse:
+        return self.get(request, *args, **kwargs)
 
-    def get(self, request:HttpRequest, *args:Optional[Any], **kwargs:Optional[Any]) -> JsonResponse:
-        return JsonResponse(self.viewset.table.data)
 
-    def post(self, request:HttpRequest, *args:Optional[Any], **kwargs:Optional[Any]) -> JsonResponse:
-        return self.get(request, *args, **kwargs)
+class HtmxExportView(SerializerMixin, HtmxModelView, ListView):
+    """
+    Streams the table queryset (filtered, grouped, searched and ordered)
+    with its visible columns, ?format=csv (default) or ?format=ndjson.
+    """
+    template_name = ''
+    code = 'export'
+    components = ('table',)
+    exporter_classes = EXPORTERS
+
+    def get(self, request:HttpRequest, *args:Optional[Any], **kwargs:Optional[Any]) -> HttpResponse:
+        exporter_class = self.exporter_classes.get(
+            request.GET.get('format', 'csv'))
+        if exporter_class is None:
+            return HttpResponseBadRequest('Unknown export format')
+        exporter = exporter_class(self.viewset.table,
+                                  self.get_serializer().dumps)
+        response = StreamingHttpResponse(
+            exporter, content_type=exporter.content_type)
+        filename = exporter.get_filename(self.viewset.node_id)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class HtmxDetailView(HtmxModelView, DetailView):
     template_name = 'htmx_viewsets/detail.html'
     code = 'detail'
+    components = ('table',)
 
 
 class HtmxCreateView(HtmxModelView, CreateView):
@@ -194,14 +372,24 @@ class HtmxDeleteView(HtmxModelView, DeleteView):
     def form_valid(self, form: forms.Form) -> HttpResponse:
         super().form_valid(form)
         if self.request.htmx:
-            return RefreshDataTableResponse(self.viewset.table.table_id)
+            return RefreshDataTableResponse(self.viewset.table_id)
         return redirect(self.get_next_url())
 
 
-class HtmxChartDataView(HtmxModelView, ListView):
+class HtmxChartDataView(ConditionalMixin, SerializerMixin, HtmxModelView, ListView):
     code            : str = 'chart'
+    components = ('chart',)
     charts          : List['chart.ChartBase']
     template_name = ''
 
-    def get(self, request:HttpRequest, *args:Optional[Any], **kwargs:Optional[Any]) -> JsonResponse:
-        return JsonResponse({'data': self.viewset.chart.data})
+    def get(self, request:HttpRequest, *args:Optional[Any], **kwargs:Optional[Any]) -> HttpResponse:
+        return self.conditional_response(request, self.render_chart)
+
+    def render_chart(self) -> HttpResponse:
+        data = self.viewset.get_cached_data('chart', self.get_chart_data)
+        return self.render_json({'data': data})
+
+    def get_chart_data(self) -> Dict[str, Any]:
+        data = self.viewset.chart.data
+        data['datasets'] = [dict(dataset) for dataset in data['datasets']]
+        return data
@@ -1,9 +1,11 @@
 from collections import OrderedDict
 from copy import copy
+from functools import partial
 from abc import ABC
 from typing import Iterable, Optional
 
 from django.urls.conf import path
+from django.utils.functional import cached_property
 from django.db.models.query import QuerySet
 from django import forms
 from django.db.models.aggregates import Count, Avg, Sum, Min, Max, Variance,\
@@ -18,6 +20,14 @@ from django.db.models.fields import DateTimeField, DateField, TimeField,\
 from .forms import (FilterForm, AddFilterForm, RemoveFilterForm,
                     GroupByForm)
 from .fields import ViewsetModelField
+from .metadata import ViewsetMetadata
+from .aggregates import AggregateEngine, FallbackQuerySet, Median,\
+    Percentile
+from .rollups import Rollup, RollupQuerySet, rollups
+from .search import SearchIndex, search_indexes
+from .results import ResultCache, SingleFlight, get_query_state,\
+    get_state_key
+from .versions import data_versions
 from .table import Table
 from .chart import MixedChart
 from . import views
@@ -55,6 +65,10 @@ NUMBER_AGGREGATES = {
     'max':      Max,
     'variance': Variance,
     'stddev':   StdDev,
+    'median':   Median,
+    'p25':      Percentile.of(25),
+    'p75':      Percentile.of(75),
+    'p90':      Percentile.of(90),
 }
 
 
@@ -87,6 +101,7 @@ class HtmxViewSetBase(ABC):
         'delete':   ['{app_label}.delete_{model_name}'],
         'table':    ['{app_label}.view_{model_name}'],
         'chart':    ['{app_label}.view_{model_name}'],
+        'export':   ['{app_label}.view_{model_name}'],
     }
 
     @classmethod
@@ -165,6 +180,7 @@ class HtmxModelViewSet(HtmxViewSet):
         'delete': '<int:pk>/delete/',
         'table': 'table/',
         'chart': 'chart/',
+        'export': 'export/',
     }
     view_classes = {
         'list': views.HtmxListView,
@@ -174,10 +190,13 @@ class HtmxModelViewSet(HtmxViewSet):
         'delete': views.HtmxDeleteView,
         'table': views.HtmxTableView,
         'chart': views.HtmxChartDataView,
+        'export': views.HtmxExportView,
     }
     additional_lookups = ADDITIONAL_LOOKUPS
     default_aggregates = AGGREGATES
+    aggregate_engine_class = AggregateEngine
     field_class = ViewsetModelField
+    metadata_class = ViewsetMetadata
 
     filter_form_class: Optional[forms.Form] = FilterForm
     add_filter_form_class: Optional[forms.Form] = AddFilterForm
@@ -196,50 +215,226 @@ class HtmxModelViewSet(HtmxViewSet):
     prefetch_related: Iterable[str] = None
     select_related: Iterable[str] = None
     aggregate_count_pk = True
-
-    def __init__(self, request):
+    # Preselected aggregates (keys of default_aggregates values) and fields
+    # (None = all fields with aggregates) of grouped querysets
+    group_by_aggregates: Iterable[str] = ('sum', 'avg', 'min', 'max')
+    group_by_aggregate_fields: Optional[Iterable[str]] = None
+
+    # Cache table and chart data, e.g. result_cache_class = ResultCache
+    result_cache_class: Optional[ResultCache] = None
+    result_cache_timeout: Optional[int] = 300
+    result_cache_max_entries: int = 100
+    # Coalesce identical concurrent data requests, SingleFlight (threads of
+    # a process) or CacheSingleFlight (processes sharing a cache)
+    single_flight_class: Optional[SingleFlight] = None
+    # Group by lookups answered from rollups (see rollups.py) while the
+    # grouped queryset is unfiltered, e.g. ['datetime__trunc_day']
+    rollup_lookups: Iterable[str] = ()
+    rollup_class = Rollup
+    # Search of the table search box, e.g. SqliteFtsIndex (see search.py),
+    # over search_fields (None = the text columns of the table)
+    search_index_class: Optional[SearchIndex] = None
+    search_fields: Optional[Iterable[str]] = None
+
+    # Components built (lazily) for the requesting view
+    components: Iterable[str] = ('table', 'chart')
+
+    _metadata: Optional[ViewsetMetadata] = None
+
+    def __init__(self, request, components=None):
         self.request = request
-        self.register_lookups()
+        if components is not None:
+            self.components = components
+        self.metadata = self.get_metadata()
 
-        # Build forms from annotated QuerySet
+        # Build forms from the class level lookups
         self.add_filter_form = self.add_filter_form_class(
-            request, self.get_lookups(self.base_queryset))
+            request, self.metadata.lookups)
 
         self.remove_filter_form = self.remove_filter_form_class(
-            request, self.get_lookups(self.base_queryset))
+            request, self.metadata.lookups)
 
         self.filter_form = self.filter_form_class(
-            request, self.get_lookups(self.base_queryset))
+            request, self.metadata.lookups)
 
         self.group_by_form = self.group_by_form_class(
-            request, self.get_group_by_lookups(self.base_queryset))
-
-        qs = self.get_queryset()
-        self.viewset_fields = self.get_fields(qs)
-        self.chart = self.get_chart(qs, self.viewset_fields)
-        self.table = self.get_table(qs, self.viewset_fields)
+            request, self.metadata.group_by_lookups,
+            aggregates=self.metadata.aggregate_choices,
+            aggregate_fields=self.metadata.aggregate_field_choices,
+            defaults=self.get_group_by_defaults())
+
+        self.queryset = self.get_queryset()
+        self.viewset_fields = self.get_fields(self.queryset)
+
+    @cached_property
+    def chart(self):
+        return self.get_chart(self.queryset, self.viewset_fields)
+
+    @cached_property
+    def table(self):
+        return self.get_table(self.queryset, self.viewset_fields)
+
+    @property
+    def table_id(self):
+        return f'{self.node_id}-table'
+
+    def get_group_by_defaults(self):
+        fields = self.group_by_aggregate_fields
+        if fields is None:
+            fields = [name for name, _ in self.metadata.aggregate_field_choices]
+        return {
+            'aggregates': [*self.group_by_aggregates],
+            'aggregate_fields': [*fields],
+        }
 
-    def annotate_aggregates(self, qs):
+    def annotate_aggregates(self, qs, source):
+        """
+        Only the aggregates and fields selected in the group by form.
+        source: the rows of the grouped qs, used for fallback aggregates.
+        """
         if self.aggregate_count_pk:
             qs = qs.annotate(Count('pk'))
+        selected = self.group_by_form.cleaned_data
+        aggregate_names = selected.get('aggregates', [])
+        field_names = selected.get('aggregate_fields', [])
+        annotations = {}
         for field in qs.query.get_meta().fields:
+            if field.name not in field_names:
+                continue
             aggregates = self.default_aggregates.get(field.__class__, {})
             for name, func in aggregates.items():
-                qs = qs.annotate(**{f'{field.name}__{name}': func(field.name)})
-        return qs
+                if name in aggregate_names:
+                    annotations[f'{field.name}__{name}'] = func(field.name)
+        engine = self.aggregate_engine_class(qs.db)
+        return engine.annotate(qs, source, selected['group_by'], annotations)
+
+    @classmethod
+    def get_aggregate_choices(cls):
+        choices = OrderedDict()
+        for aggregates in cls.default_aggregates.values():
+            for name, func in aggregates.items():
+                choices[name] = func.__name__
+        return [*choices.items()]
+
+    @classmethod
+    def get_aggregate_field_choices(cls, qs):
+        return [(field.name, field.verbose_name)
+                for field in qs.query.get_meta().fields
+                if field.__class__ in cls.default_aggregates]
+
+    @classmethod
+    def get_metadata(cls):
+        """
+        Metadata is built on first use and cached on the viewset class.
+        """
+        metadata = cls.__dict__.get('_metadata', None)
+        if metadata is None:
+            metadata = cls.metadata_class(cls)
+            cls._metadata = metadata
+        return metadata
+
+    @classmethod
+    def get_result_cache(cls):
+        if cls.result_cache_class is None:
+            return None
+        return cls.result_cache_class(
+            f'{cls.namespace}:{cls.node_id}',
+            timeout=cls.result_cache_timeout,
+            max_entries=cls.result_cache_max_entries,
+        )
+
+    @classmethod
+    def get_rollups(cls):
+        fields = [name for name, _ in
+                  cls.get_aggregate_field_choices(cls.base_queryset)]
+        return [cls.rollup_class(f'{cls.namespace}:{cls.node_id}',
+                                 cls.base_queryset, lookup, fields)
+                for lookup in cls.rollup_lookups]
+
+    @classmethod
+    def register_rollups(cls):
+        """
+        Registers the lookups too, the signal handlers query the buckets.
+        """
+        if cls.rollup_lookups:
+            cls.register_lookups()
+        for rollup in cls.get_rollups():
+            rollups.register(rollup)
+
+    @classmethod
+    def get_search_index(cls):
+        if cls.search_index_class is None:
+            return None
+        fields = cls.search_fields
+        if fields is None:  # The text columns of the table
+            fields = cls.search_index_class.get_default_fields(cls.model)
+            if isinstance(cls.fields, list):
+                fields = [name for name in fields if name in cls.fields]
+        return cls.search_index_class(cls.model, fields)
+
+    @classmethod
+    def register_search_index(cls):
+        search_index = cls.get_search_index()
+        if search_index is not None:
+            search_indexes.register(search_index)
+
+    def get_rollup_queryset(self, qs):
+        """
+        Reads qs from the rollup of the group by lookup, if there is one.
+        """
+        rollup = self.metadata.rollups.get(
+            self.group_by_form.cleaned_data['group_by'])
+        if rollup is None or isinstance(qs, FallbackQuerySet):
+            return qs  # Fallback aggregates are not in the rollup anyway
+        return RollupQuerySet.from_queryset(qs, rollup)
+
+    def get_version_models(self):
+        """
+        Models the table and chart data depend on.
+        """
+        version_models = {self.model}
+        for field in self.viewset_fields:
+            related_model = getattr(field.model_field, 'related_model', None)
+            if related_model is not None:
+                version_models.add(related_model)
+        return [*version_models]
+
+    def get_data_versions(self):
+        return data_versions.get_many(self.get_version_models())
+
+    def get_cached_data(self, kind, build):
+        """
+        Result of build(), shared by all requests with the same query state
+        while the data is unchanged.
+        """
+        result_cache = self.metadata.result_cache
+        single_flight = self.metadata.single_flight
+        if result_cache is None and single_flight is None:
+            return build()
+        state = get_query_state(self.request)
+        versions = self.get_data_versions()
+        if single_flight is not None:
+            key = get_state_key(
+                f'{self.namespace}:{self.node_id}', kind, state, versions)
+            build = partial(single_flight.do, key, build)
+        if result_cache is None:
+            return build()
+        return result_cache.get_or_set(kind, state, versions, build)
 
     def get_lookups(self, qs, only_groupable=False):
-        viewset_fields = self.get_fields(qs)
-        lookups = []
-        for field in viewset_fields:
-            lookups += field.get_lookups(only_groupable=only_groupable)
-        return lookups
+        if qs is self.base_queryset:
+            if only_groupable:
+                return self.metadata.group_by_lookups
+            return self.metadata.lookups
+        return self.metadata_class.get_lookups(
+            self.get_fields(qs), only_groupable=only_groupable)
 
     def get_group_by_lookups(self, qs):
         return self.get_lookups(qs, only_groupable=True)
 
-    def register_lookups(self):
-        for field_cls, lookups in self.additional_lookups.items():
+    @classmethod
+    def register_lookups(cls):
+        for field_cls, lookups in cls.additional_lookups.items():
             for expression, func in lookups.items():
                 field_cls.register_lookup(func, lookup_name=expression)
 
@@ -258,45 +453,57 @@ class HtmxModelViewSet(HtmxViewSet):
         # Group QuerySet
         if self.group_by_form.is_valid() \
                 and self.group_by_form.cleaned_data.get('group_by', None):
-            qs = self.group_by_form.group_qs_by(qs)
-            qs = self.annotate_aggregates(qs)
+            grouped = self.group_by_form.group_qs_by(qs)
+            qs = self.annotate_aggregates(grouped, qs)
+            qs = self.get_rollup_queryset(qs)
         return qs
 
 
-    def get_context_data(self):
-        qs = self.get_queryset()
+    def get_context_data(self, components=None):
+        """
+        components: the ones rendered by the template, default: all of the
+        viewset. The table page context runs the count query.
+        """
+        if components is None:
+            components = self.components
         ctx = {
-            'fields': self.get_fields(qs),
+            'fields': self.viewset_fields,
             'target_url': self.request.path,
             'create_url': self.url_names.get('create', None),
+            'export_url': self.url_names.get('export', None),
             'verbose_name': self.model._meta.verbose_name,
             'verbose_name_plural': self.model._meta.verbose_name_plural,
             'dispatch_template': f'htmx_viewsets/partial.html,{self.full_template_name}',
 
             'node_id': self.node_id,
-            'chart': self.get_chart(qs, self.get_fields(qs)),
             'add_filter_form': self.add_filter_form,
             'remove_filter_form': self.remove_filter_form,
             'enabled_filter_form': self.filter_form,
             'group_by_form': self.group_by_form,
             'get_kwargs': self.request.GET.urlencode(),
-            **self.table.get_context_data(),
         }
+        if 'chart' in components:
+            ctx['chart'] = self.chart
+        if 'table' in components:
+            ctx.update(self.table.get_context_data())
         return ctx
 
     def get_fields(self, qs):
-        if qs.query.group_by:
-            fields = [
+        if not qs.query.group_by:
+            return self.metadata.fields
+        data = self.group_by_form.cleaned_data
+        key = (data['group_by'], tuple(data.get('aggregates', ())),
+               tuple(data.get('aggregate_fields', ())))
+        return self.metadata.get_grouped_fields(
+            key, lambda: self.filter_fields([
                 *self.get_group_by_fields(qs),
                 *self.get_aggregate_fields(qs),
-            ]
-        else:
-            fields = [
-                *self.get_annotated_fields(qs),
-                *self.get_model_fields(qs),
-            ]
-        if isinstance(self.fields, list):
-            fields = [field for field in fields if field.name in self.fields]
+            ]))
+
+    @classmethod
+    def filter_fields(cls, fields):
+        if isinstance(cls.fields, list):
+            fields = [field for field in fields if field.name in cls.fields]
         return fields
 
     def get_group_by_fields(self, qs):
@@ -317,29 +524,32 @@ class HtmxModelViewSet(HtmxViewSet):
                 fields[name] = self.field_class(field, qs)
         return [*fields.values()]
 
-    def get_model_fields(self, qs):
+    @classmethod
+    def get_model_fields(cls, qs):
         model_fields = qs.query.get_meta().fields
-        fields = (self.field_class(field, qs) for field in model_fields)
+        fields = (cls.field_class(field, qs) for field in model_fields)
         return fields
 
-    def get_annotated_fields(self, qs):
+    @classmethod
+    def get_annotated_fields(cls, qs):
         fields = OrderedDict()
         for name, field in qs.query.annotations.items():
             field = copy(field.output_field)
             field.name = name
-            fields[name] = self.field_class(field, qs)
-        return fields
+            fields[name] = cls.field_class(field, qs)
+        return [*fields.values()]
 
     def get_chart(self, qs, fields):
         if self.chart_class:
             chart_id = f'chart_{self.node_id}'
-            return self.chart_class(qs, fields, chart_id, self.url_names)
+            return self.chart_class(qs, fields, chart_id, self.url_names,
+                                    label_field=self.label_field)
         return None
 
     def get_table(self, qs, fields):
-        table_id = f'{self.node_id}-table'
         return self.table_class(
-            self.request, qs, fields, table_id, self.url_names)
+            self.request, qs, fields, self.table_id, self.url_names,
+            self.metadata.url_templates, self.metadata.search_index)
 
 
 def modelviewset_factory(model=None, queryset=None, permissions=None, **kwargs):
@@ -361,4 +571,6 @@ def modelviewset_factory(model=None, queryset=None, permissions=None, **kwargs):
     cls = type(cls.__name__, (cls,), kwargs)
     setattr(cls, 'url_names', cls.get_url_names())
     setattr(cls, 'urls', cls.get_urls())
+    cls.register_rollups()
+    cls.register_search_index()
     return cls